@@ -1,3 +1,67 @@
-from .client import AsyncIamport, HttpError, ResponseError
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
-__all__ = ["AsyncIamport", "HttpError", "ResponseError"]
+from .batch import ScheduleBatcher
+from .client import AsyncIamport, HttpError, PaymentVerification, ResponseError
+from .endpoints import EndpointPool
+from .keyed import KeyedExecutor, OrderedCanceller
+from .limiter import AdaptiveLimiter, LimitExceeded
+from .scheduler import Priority, PriorityScheduler, priority
+
+if TYPE_CHECKING:
+    from .journal import Journal
+    from .reconcile import ReconciliationRunner
+    from .renewal import (
+        DueSubscription,
+        IteratorSubscriptionSource,
+        RenewalEngine,
+        RenewalResult,
+        SQLiteSubscriptionSource,
+        SubscriptionSource,
+    )
+
+# imported on first use, they pull in sqlite3, multiprocessing and so on
+_LAZY = {
+    "DueSubscription": ".renewal",
+    "IteratorSubscriptionSource": ".renewal",
+    "Journal": ".journal",
+    "ReconciliationRunner": ".reconcile",
+    "RenewalEngine": ".renewal",
+    "RenewalResult": ".renewal",
+    "SQLiteSubscriptionSource": ".renewal",
+    "SubscriptionSource": ".renewal",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = [
+    "AdaptiveLimiter",
+    "AsyncIamport",
+    "DueSubscription",
+    "EndpointPool",
+    "HttpError",
+    "IteratorSubscriptionSource",
+    "Journal",
+    "KeyedExecutor",
+    "LimitExceeded",
+    "OrderedCanceller",
+    "PaymentVerification",
+    "Priority",
+    "PriorityScheduler",
+    "ReconciliationRunner",
+    "RenewalEngine",
+    "RenewalResult",
+    "ResponseError",
+    "SQLiteSubscriptionSource",
+    "ScheduleBatcher",
+    "SubscriptionSource",
+    "priority",
+]
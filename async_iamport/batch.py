@@ -0,0 +1,200 @@
+import asyncio
+import json
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple, cast
+
+from .client import HttpError, ResponseError
+
+if TYPE_CHECKING:
+    from .client import AsyncIamport
+
+DEFAULT_MAX_DELAY = 0.05  # seconds
+DEFAULT_MAX_SIZE = 100
+
+_BatchKey = Tuple[str, str, str]
+
+
+class _Batch:
+    def __init__(self, customer_uid: str, extra: Dict[str, Any]) -> None:
+        self.customer_uid = customer_uid
+        self.extra = extra
+        self.calls: List[Tuple[List[Any], asyncio.Future]] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ScheduleBatcher:
+    """
+    gather pay_schedule / pay_unschedule calls and send them per customer_uid
+
+    calls for the same customer_uid within max_delay seconds (or until
+    max_size schedules are gathered) are merged into one request,
+    then each caller gets back only the results of its own schedules.
+    """
+
+    def __init__(
+        self,
+        iamport: "AsyncIamport",
+        *,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be positive")
+        self.iamport = iamport
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self._batches: Dict[_BatchKey, _Batch] = {}
+        self._tasks: Set[asyncio.Future] = set()
+
+    async def pay_schedule(self, **kwargs) -> List[Dict]:
+        """
+        register scheduled payment through batch
+
+        POST 'IAMPORT_API_URL/subscribe/payments/schedule'
+
+        :param kwargs: keyword arguments
+        :return: registered schedules of this call
+        """
+        customer_uid = kwargs.pop("customer_uid")
+        schedules = list(kwargs.pop("schedules"))
+        return await self._enqueue("schedule", customer_uid, schedules, kwargs)
+
+    async def pay_unschedule(self, **kwargs) -> List[Dict]:
+        """
+        cancel scheduled payment through batch
+
+        POST 'IAMPORT_API_URL/subscribe/payments/unschedule'
+
+        without merchant_uid, all schedules of customer_uid are cancelled
+        at once so the call is sent directly.
+
+        :param kwargs: keyword arguments
+        :return: cancelled schedules of this call
+        """
+        merchant_uid = kwargs.pop("merchant_uid", None)
+        if merchant_uid is None:
+            # response is the list of cancelled schedules
+            return cast(List[Dict], await self.iamport.pay_unschedule(**kwargs))
+        customer_uid = kwargs.pop("customer_uid")
+        if isinstance(merchant_uid, str):
+            merchant_uids = [merchant_uid]
+        else:
+            merchant_uids = list(merchant_uid)
+        return await self._enqueue("unschedule", customer_uid, merchant_uids, kwargs)
+
+    async def flush(self) -> None:
+        """
+        send every gathered batch now and wait until they are finished
+        """
+        for key in list(self._batches):
+            self._flush_key(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.flush()
+
+    async def _enqueue(
+        self, kind: str, customer_uid: str, items: List[Any], extra: Dict[str, Any]
+    ) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        key = (kind, customer_uid, json.dumps(extra, sort_keys=True, default=str))
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(customer_uid, extra)
+            batch.timer = loop.call_later(self.max_delay, self._flush_key, key)
+        future = loop.create_future()
+        batch.calls.append((items, future))
+        batch.size += len(items)
+        if batch.size >= self.max_size:
+            self._flush_key(key)
+        return await future
+
+    def _flush_key(self, key: _BatchKey) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.ensure_future(self._send(key[0], batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, kind: str, batch: _Batch) -> None:
+        items = [item for call_items, _ in batch.calls for item in call_items]
+        try:
+            results = await self._request(kind, batch, items)
+        except (ResponseError, HttpError) as e:
+            if len(batch.calls) > 1 and self._rejected(e):
+                # one bad schedule fails the whole request,
+                # so retry per caller to find out whose it was
+                await asyncio.gather(
+                    *(self._send_single(kind, batch, call) for call in batch.calls)
+                )
+                return
+            self._fail(batch.calls, e)
+            return
+        except Exception as e:
+            self._fail(batch.calls, e)
+            return
+        self._fan_out(kind, batch.calls, results)
+
+    @staticmethod
+    def _rejected(error: Exception) -> bool:
+        """
+        refused for its content, not for the server or the rate
+        """
+        if isinstance(error, HttpError):
+            return (
+                HTTPStatus.BAD_REQUEST <= error.code < HTTPStatus.INTERNAL_SERVER_ERROR
+                and error.code != HTTPStatus.TOO_MANY_REQUESTS
+            )
+        return True
+
+    async def _send_single(
+        self, kind: str, batch: _Batch, call: Tuple[List[Any], asyncio.Future]
+    ) -> None:
+        try:
+            results = await self._request(kind, batch, call[0])
+        except Exception as e:
+            self._fail([call], e)
+        else:
+            self._fan_out(kind, [call], results)
+
+    async def _request(self, kind: str, batch: _Batch, items: List[Any]) -> Any:
+        if kind == "schedule":
+            return await self.iamport.pay_schedule(
+                customer_uid=batch.customer_uid, schedules=items, **batch.extra
+            )
+        return await self.iamport.pay_unschedule(
+            customer_uid=batch.customer_uid, merchant_uid=items, **batch.extra
+        )
+
+    @staticmethod
+    def _fan_out(
+        kind: str, calls: List[Tuple[List[Any], asyncio.Future]], results: List[Dict]
+    ) -> None:
+        by_merchant_uid = {result.get("merchant_uid"): result for result in results}
+        for items, future in calls:
+            if future.done():
+                continue
+            if kind == "schedule":
+                merchant_uids = [item.get("merchant_uid") for item in items]
+            else:
+                merchant_uids = items
+            future.set_result(
+                [
+                    by_merchant_uid[merchant_uid]
+                    for merchant_uid in merchant_uids
+                    if merchant_uid in by_merchant_uid
+                ]
+            )
+
+    @staticmethod
+    def _fail(
+        calls: List[Tuple[List[Any], asyncio.Future]], error: BaseException
+    ) -> None:
+        for _, future in calls:
+            if not future.done():
+                future.set_exception(error)
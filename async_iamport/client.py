@@ -1,15 +1,43 @@
+import asyncio
 import json
+import time
+from contextlib import contextmanager
 from http import HTTPStatus
 from socket import AF_INET
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
 
 import aiohttp
-import arrow
+
+from .endpoints import EndpointPool
+from .limiter import AdaptiveLimiter, LimitExceeded
+from .scheduler import Priority, PriorityScheduler, current_priority, priority
+
+if TYPE_CHECKING:
+    import arrow
+
+    from .journal import Journal
 
 IAMPORT_API_URL = "https://api.iamport.kr"
 TOKEN_REFRESH_GAP = 60  # token 만료 1500s 정도
 DEFAULT_TIMEOUT = 5
 DEFAULT_POOL_SIZE = 100
+CUSTOMER_CHUNK_SIZE = 100
+CUSTOMER_CONCURRENCY = 4
 
 
 class ResponseError(Exception):
@@ -24,20 +52,68 @@ class HttpError(Exception):
         self.reason = reason
 
 
+class PaymentVerification(NamedTuple):
+    """
+    result of AsyncIamport.verify_payment
+    """
+
+    payment: Dict[str, Any]
+    # status is paid and amount is expected_amount
+    paid: bool
+    # merchant_uid of the payment is the expected one
+    merchant_uid_matched: bool
+    # prepared amount is expected_amount, None when nothing was prepared
+    prepared: Optional[bool]
+    # cancel response when the payment was cancelled on mismatch
+    cancelled: Optional[Dict[str, Any]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.paid and self.merchant_uid_matched and self.prepared is not False
+
+
+_JSON_HEADERS: Mapping[str, str] = MappingProxyType(
+    {"Content-Type": "application/json"}
+)
+
+
 class AsyncIamport:
     """
     sync Iamport -> async Iamport
     """
 
+    __slots__ = (
+        "imp_key",
+        "imp_secret",
+        "imp_url",
+        "pool_size",
+        "time_out",
+        "token_refresh_gap",
+        "token",
+        "session",
+        "endpoints",
+        "scheduler",
+        "limiter",
+        "journal",
+        "_token_expired_at",
+        "_token_deadline",
+        "_token_lock",
+        "_auth_headers",
+        "_auth_json_headers",
+    )
+
     def __init__(
         self,
         *,
         imp_key: Optional[str] = None,
         imp_secret: Optional[str] = None,
-        imp_url: str = IAMPORT_API_URL,
+        imp_url: Union[str, Sequence[str]] = IAMPORT_API_URL,
         pool_size: int = DEFAULT_POOL_SIZE,
         time_out: int = DEFAULT_TIMEOUT,
         token_refresh_gap: int = TOKEN_REFRESH_GAP,
+        reserved_interactive: Optional[int] = None,
+        journal: Optional["Journal"] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
     ) -> None:
         if imp_key is None or imp_secret is None:
             raise ValueError("IMP_KEY OR IMP_SECRET MISSED")
@@ -48,63 +124,216 @@ class AsyncIamport:
         self.time_out = time_out
         self.token_refresh_gap = token_refresh_gap
         self.token: Optional[str] = None
-        self.token_expire: Optional[arrow.Arrow] = None
+        # expired_at as unix timestamp, and the same moment on monotonic clock
+        self._token_expired_at: Optional[float] = None
+        self._token_deadline: Optional[float] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._auth_headers: Mapping[str, str] = MappingProxyType({})
+        self._auth_json_headers: Mapping[str, str] = _JSON_HEADERS
         self.session: Optional[aiohttp.ClientSession] = None
+        # with several imp_url, each has its own session in the pool
+        # and self.session is the one of the first url
+        self.endpoints: Optional[EndpointPool] = None
+        # keep `reserved_interactive` of pool_size slots for interactive calls
+        self.scheduler: Optional[PriorityScheduler] = None
+        if reserved_interactive is not None:
+            self.scheduler = PriorityScheduler(pool_size, reserved_interactive)
+        # in-flight limit adjusted by latency, applied after the scheduler
+        self.limiter = limiter
+        if self.scheduler is not None and self.limiter is not None:
+            self.scheduler.resize(self.limiter.limit)
+        # write-ahead records of cancel, pay_again, pay_onetime and prepare
+        self.journal = journal
 
         self._init_session()
 
     def _init_session(self) -> None:
         if self.session is None:
-            timeout = aiohttp.ClientTimeout(total=self.time_out)
-            connector = aiohttp.TCPConnector(
-                family=AF_INET, limit_per_host=self.pool_size
-            )
-            self.session = aiohttp.ClientSession(
-                base_url=self.imp_url, timeout=timeout, connector=connector
-            )
+            if isinstance(self.imp_url, str):
+                self.session = self._make_session(self.imp_url)
+            else:
+                self.endpoints = EndpointPool(self.imp_url, self._make_session)
+                self.session = self.endpoints.endpoints[0].session
+
+    def _make_session(self, base_url: str) -> aiohttp.ClientSession:
+        timeout = aiohttp.ClientTimeout(total=self.time_out)
+        connector = aiohttp.TCPConnector(family=AF_INET, limit_per_host=self.pool_size)
+        return aiohttp.ClientSession(
+            base_url=base_url, timeout=timeout, connector=connector
+        )
 
     async def close_session(self) -> None:
+        if self.endpoints is not None:
+            await self.endpoints.close()
+            self.endpoints = None
+            self.session = None
         if self.session:
             await self.session.close()
             self.session = None
 
-    async def _get(self, url, payload=None) -> Dict:
-        headers = await self._get_auth_headers()
-        if self.session is not None:
-            response = await self.session.get(url, headers=headers, params=payload)
-            return await self.get_response(response)
-        else:
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        kwargs: Dict,
+        retriable: Optional[bool] = None,
+    ) -> aiohttp.ClientResponse:
+        if self.session is None:
             raise ConnectionError("SESSION IS CLOSED")
+        if self.endpoints is None:
+            return await self.session.request(method, url, headers=headers, **kwargs)
+        return await self.endpoints.request(
+            method, url, retriable=retriable, headers=headers, **kwargs
+        )
 
-    async def _post(self, url, payload=None) -> Dict:
-        headers = await self._get_auth_headers()
-        headers["Content-Type"] = "application/json"
-        if self.session is not None:
-            response = await self.session.post(
-                url, headers=headers, data=json.dumps(payload)
-            )
-            return await self.get_response(response)
+    @contextmanager
+    def priority(self, value: Priority) -> Iterator[None]:
+        """
+        run calls inside the block with the given priority
+
+        :param value: Priority.INTERACTIVE or Priority.BACKGROUND
+        """
+        with priority(value):
+            yield
+
+    async def _request(self, method: str, url: str, **kwargs) -> Any:
+        await self._get_token()
+        if "data" in kwargs:
+            headers = self._auth_json_headers
         else:
+            headers = self._auth_headers
+        if self.session is None:
             raise ConnectionError("SESSION IS CLOSED")
-
-    async def _put(self, url, payload=None) -> Dict[str, Any]:
-        headers = await self._get_auth_headers()
-        headers["Content-Type"] = "application/json"
-        if self.session is not None:
-            response = await self.session.put(
-                url, headers=headers, data=json.dumps(payload)
-            )
+        if self.scheduler is None and self.limiter is None:
+            response = await self._send(method, url, headers, kwargs)
             return await self.get_response(response)
-        else:
+        await self._acquire_slot()
+        rtt: Optional[float] = None
+        dropped = False
+        start = time.monotonic()
+        try:
+            response = await self._send(method, url, headers, kwargs)
+            rtt = time.monotonic() - start
+            dropped = response.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+            return await self.get_response(response)
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            dropped = True
+            raise
+        finally:
+            self._release_slot(rtt, dropped)
+
+    async def _acquire_slot(self) -> None:
+        if self.scheduler is not None:
+            level = current_priority.get()
+            limiter = self.limiter
+            if (
+                limiter is not None
+                and limiter.max_queue is not None
+                and not self.scheduler.can_acquire(level)
+                and self.scheduler.waiting_ahead(level) >= limiter.max_queue
+            ):
+                # calls queue up in the scheduler, so shed by its queue,
+                # lower priority calls waiting behind do not count
+                raise LimitExceeded(limiter.limit, self.scheduler.waiting_ahead(level))
+            await self.scheduler.acquire(level)
+            if limiter is not None:
+                limiter.acquire_nowait()
+        elif self.limiter is not None:
+            await self.limiter.acquire()
+
+    def _release_slot(self, rtt: Optional[float], dropped: bool) -> None:
+        """
+        :param rtt: seconds until the response headers, None when not received
+        :param dropped: failed by timeout, network error or 5xx
+        """
+        if self.limiter is not None:
+            self.limiter.release(rtt, dropped)
+            if self.scheduler is not None:
+                # limiter sets the capacity, scheduler decides who goes first
+                self.scheduler.resize(self.limiter.limit)
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+    async def _get_stream(self, url, payload=None) -> AsyncGenerator[Dict, None]:
+        """
+        GET a list response and yield its items while the body is read
+
+        the request slot is held until the iteration ends
+        """
+        from .stream import iter_response_list
+
+        await self._get_token()
+        if self.session is None:
             raise ConnectionError("SESSION IS CLOSED")
+        await self._acquire_slot()
+        rtt: Optional[float] = None
+        dropped = False
+        start = time.monotonic()
+        try:
+            response = await self._send(
+                "GET", url, self._auth_headers, {"params": payload}
+            )
+            rtt = time.monotonic() - start
+            try:
+                if response.status != HTTPStatus.OK:
+                    dropped = response.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+                    raise HttpError(response.status, response.reason or "")
+                async for item in iter_response_list(response):
+                    yield item
+            finally:
+                response.release()
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            dropped = True
+            raise
+        finally:
+            if self.scheduler is not None or self.limiter is not None:
+                self._release_slot(rtt, dropped)
+
+    @property
+    def concurrency_limit(self) -> int:
+        """
+        current in-flight limit of API requests
+        """
+        if self.limiter is not None:
+            return self.limiter.limit
+        if self.scheduler is not None:
+            return self.scheduler.capacity
+        return self.pool_size
+
+    async def _get(self, url, payload=None) -> Dict:
+        return await self._request("GET", url, params=payload)
+
+    async def _post(self, url, payload=None) -> Dict:
+        return await self._request("POST", url, data=json.dumps(payload))
+
+    async def _put(self, url, payload=None) -> Dict[str, Any]:
+        return await self._request("PUT", url, data=json.dumps(payload))
 
     async def _delete(self, url) -> Dict:
-        headers = await self._get_auth_headers()
-        if self.session is not None:
-            response = await self.session.delete(url, headers=headers)
-            return await self.get_response(response)
-        else:
-            raise ConnectionError("SESSION IS CLOSED")
+        return await self._request("DELETE", url)
+
+    async def _post_journaled(self, op: str, url: str, payload: Dict) -> Dict:
+        """
+        POST with begin/end records in the journal around it
+
+        the entry stays pending when the outcome is unknown
+        (connection error, timeout, 5xx) until Journal.recover() looks it up.
+        """
+        if self.journal is None:
+            return await self._post(url, payload)
+        entry_id = await self.journal.begin(op, payload)
+        try:
+            response = await self._post(url, payload)
+        except ResponseError as e:
+            self.journal.end(entry_id, error={"code": e.code, "message": e.message})
+            raise
+        except HttpError as e:
+            if e.code < HTTPStatus.INTERNAL_SERVER_ERROR:
+                self.journal.end(entry_id, error={"code": e.code, "message": e.reason})
+            raise
+        self.journal.end(entry_id, response)
+        return response
 
     @staticmethod
     async def get_response(response) -> Dict:
@@ -115,33 +344,67 @@ class AsyncIamport:
             raise ResponseError(result.get("code"), result.get("message"))
         return result.get("response")
 
-    async def _get_auth_headers(self) -> Dict:
-        return {"Authorization": await self._get_token()}
+    @property
+    def token_expire(self) -> Optional["arrow.Arrow"]:
+        if self._token_expired_at is None:
+            return None
+        import arrow
 
-    async def _get_token(self) -> Optional[str]:
-        if (
+        return arrow.Arrow.utcfromtimestamp(self._token_expired_at)
+
+    @token_expire.setter
+    def token_expire(self, value) -> None:
+        """
+        :param value: arrow.Arrow or aware datetime or None
+        """
+        if value is None:
+            self._token_expired_at = self._token_deadline = None
+        else:
+            self._set_expire(value.timestamp(), time.time())
+
+    def _set_expire(self, expired_at: float, now: float) -> None:
+        self._token_expired_at = expired_at
+        self._token_deadline = time.monotonic() + (expired_at - now)
+
+    def _set_token(
+        self, token: str, expired_at: Optional[float], now: Optional[float]
+    ) -> None:
+        if expired_at is not None:
+            self._set_expire(expired_at, time.time() if now is None else now)
+        self.token = token
+        self._auth_headers = MappingProxyType({"Authorization": token})
+        self._auth_json_headers = MappingProxyType(
+            {"Authorization": token, "Content-Type": "application/json"}
+        )
+
+    def _token_is_fresh(self) -> bool:
+        return (
             self.token is not None
-            and self.token_expire is not None
-            and (self.token_expire - arrow.utcnow()).seconds > self.token_refresh_gap
-        ):
+            and self._token_deadline is not None
+            and self._token_deadline - time.monotonic() > self.token_refresh_gap
+        )
+
+    async def _get_token(self) -> Optional[str]:
+        if self._token_is_fresh():
             return self.token
-        else:
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            # another call may have renewed it while waiting for the lock
+            if self._token_is_fresh():
+                return self.token
             self.token = None
             url = "/users/getToken"
             payload = {"imp_key": self.imp_key, "imp_secret": self.imp_secret}
-            if self.session is not None:
-                response = await self.session.post(
-                    url,
-                    headers={"Content-Type": "application/json"},
-                    data=json.dumps(payload),
-                )
-            else:
-                raise ConnectionError("SESSION IS CLOSED")
+            # getToken changes nothing, it is sent again on another url
+            # after a timeout like an idempotent request
+            response = await self._send(
+                "POST", url, _JSON_HEADERS, {"data": json.dumps(payload)}, True
+            )
             resp = await self.get_response(response)
-            timestamp: Optional[int] = resp.get("expired_at")
-            if timestamp is not None:
-                self.token_expire = arrow.Arrow.utcfromtimestamp(timestamp)
-            self.token = resp.get("access_token")
+            self._set_token(
+                resp["access_token"], resp.get("expired_at"), resp.get("now")
+            )
             return self.token
 
     async def find_by_status(self, status: str, **params) -> Dict:
@@ -158,6 +421,26 @@ class AsyncIamport:
         url = f"/payments/status/{status}"
         return await self._get(url, payload=params)
 
+    async def find_by_status_stream(self, status: str, **params) -> AsyncIterator[Dict]:
+        """
+        query payment history by status, yield payments of the page
+        while the response is still being read
+
+        GET 'IAMPORT_API_URL/payments/status/{status}'
+
+        :param status: ["all", "ready", "paid", "cancelled", "failed"]
+        :param params: kwargs
+        :return: async iterator of payments
+        """
+        url = f"/payments/status/{status}"
+        stream = self._get_stream(url, payload=params)
+        try:
+            async for payment in stream:
+                yield payment
+        finally:
+            # release the request slot now, not when the generator is collected
+            await stream.aclose()
+
     async def find_by_merchant_uid(
         self, merchant_uid: str, status: Optional[str] = None
     ) -> Dict:
@@ -215,7 +498,7 @@ class AsyncIamport:
         :return: result
         """
         url = "/payments/cancel"
-        return await self._post(url, payload)
+        return await self._post_journaled("cancel", url, payload)
 
     async def cancel_by_merchant_uid(
         self, merchant_uid: str, reason: str, **kwargs
@@ -286,6 +569,62 @@ class AsyncIamport:
         response_amount = response.get("amount")
         return status == "paid" and response_amount == amount
 
+    async def verify_payment(
+        self,
+        imp_uid: str,
+        merchant_uid: str,
+        expected_amount: float,
+        *,
+        auto_cancel: bool = False,
+        reason: str = "payment verification failed",
+    ) -> PaymentVerification:
+        """
+        verify a completed payment against the expected merchant_uid and amount
+
+        find_by_imp_uid and prepare_validate are sent at the same time,
+        the found payment is reused for is_paid.
+
+        :param imp_uid: iamport unique id
+        :param merchant_uid: merchant unique id
+        :param expected_amount: amount the payment should have
+        :param auto_cancel: cancel the payment when its amount does not match
+            or it was not prepared with the amount, a payment of another
+            merchant_uid is only rejected
+        :param reason: reason for cancel
+        :return: PaymentVerification
+        """
+
+        async def validate_prepare() -> Optional[bool]:
+            try:
+                return await self.prepare_validate(merchant_uid, expected_amount)
+            except ResponseError:
+                # not prepared
+                return None
+            except HttpError as e:
+                if e.code != HTTPStatus.NOT_FOUND:
+                    raise
+                return None
+
+        payment, prepared = await asyncio.gather(
+            self.find_by_imp_uid(imp_uid), validate_prepare()
+        )
+        paid = await self.is_paid(expected_amount, response=payment)
+        verification = PaymentVerification(
+            payment=payment,
+            paid=paid,
+            merchant_uid_matched=payment.get("merchant_uid") == merchant_uid,
+            prepared=prepared,
+        )
+        if (
+            auto_cancel
+            and verification.merchant_uid_matched
+            and not verification.ok
+            and payment.get("status") == "paid"
+        ):
+            cancelled = await self.cancel_by_imp_uid(imp_uid, reason)
+            verification = verification._replace(cancelled=cancelled)
+        return verification
+
     async def pay_onetime(self, **kwargs) -> Dict:
         """
         payments once only with card information
@@ -297,7 +636,7 @@ class AsyncIamport:
         """
         url = "/subscribe/payments/onetime"
 
-        return await self._post(url, kwargs)
+        return await self._post_journaled("pay_onetime", url, kwargs)
 
     async def pay_again(self, **kwargs) -> Dict:
         """
@@ -310,7 +649,7 @@ class AsyncIamport:
         """
         url = "/subscribe/payments/again"
 
-        return await self._post(url, kwargs)
+        return await self._post_journaled("pay_again", url, kwargs)
 
     async def pay_foreign(self, **kwargs) -> Dict:
         """
@@ -333,8 +672,6 @@ class AsyncIamport:
         :return: result
         """
 
-        headers = await self._get_auth_headers()
-        headers["Content-Type"] = "application/json"
         url = "/subscribe/payments/schedule"
 
         return await self._post(url, kwargs)
@@ -364,6 +701,24 @@ class AsyncIamport:
 
         return await self._get(url, kwargs)
 
+    async def pay_schedule_get_between_stream(self, **kwargs) -> AsyncIterator[Dict]:
+        """
+        query scheduled payment by datetime range, yield schedules of the page
+        while the response is still being read
+
+        GET 'IAMPORT_API_URL/subscribe/payments/schedule'
+
+        :param kwargs: keyword arguments
+        :return: async iterator of schedules
+        """
+        url = "/subscribe/payments/schedule"
+        stream = self._get_stream(url, kwargs)
+        try:
+            async for schedule in stream:
+                yield schedule
+        finally:
+            await stream.aclose()
+
     async def pay_unschedule(self, **kwargs) -> Dict:
         """
         cancel scheduled payment
@@ -403,6 +758,65 @@ class AsyncIamport:
         url = f"/subscribe/customers/{customer_uid}"
         return await self._get(url)
 
+    async def customer_get_many(
+        self,
+        customer_uids: Iterable[str],
+        *,
+        chunk_size: int = CUSTOMER_CHUNK_SIZE,
+        concurrency: int = CUSTOMER_CONCURRENCY,
+    ) -> Dict[str, Optional[Dict]]:
+        """
+        query many customer billing keys
+
+        GET 'IAMPORT_API_URL/subscribe/customers?customer_uid[]=...'
+
+        customer_uids are sent in chunks of chunk_size,
+        at most concurrency chunks at once. a chunk refused as a whole
+        (e.g. one of them is not registered) is queried one by one.
+
+        :param customer_uids: customer's payment method unique ids
+        :param chunk_size: number of customer_uid per request
+        :param concurrency: number of requests in flight
+        :return: {customer_uid: billing key or None when it is not registered}
+        """
+        uids = list(dict.fromkeys(customer_uids))
+        result: Dict[str, Optional[Dict]] = dict.fromkeys(uids)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_one(customer_uid: str) -> None:
+            try:
+                result[customer_uid] = await self.customer_get(customer_uid)
+            except ResponseError:
+                # not registered
+                pass
+            except HttpError as e:
+                if e.code != HTTPStatus.NOT_FOUND:
+                    raise
+
+        async def get_chunk(chunk: List[str]) -> None:
+            payload = [("customer_uid[]", customer_uid) for customer_uid in chunk]
+            async with semaphore:
+                try:
+                    customers = await self._get("/subscribe/customers", payload)
+                except (ResponseError, HttpError) as e:
+                    if isinstance(e, HttpError) and e.code != HTTPStatus.NOT_FOUND:
+                        raise
+                    for customer_uid in chunk:
+                        await get_one(customer_uid)
+                    return
+            for customer in customers or []:
+                customer_uid = customer.get("customer_uid")
+                if customer_uid in result:
+                    result[customer_uid] = customer
+
+        await asyncio.gather(
+            *(
+                get_chunk(uids[i : i + chunk_size])
+                for i in range(0, len(uids), chunk_size)
+            )
+        )
+        return result
+
     async def customer_delete(self, customer_uid: str) -> Dict:
         """
         delete customer billing key
@@ -426,7 +840,7 @@ class AsyncIamport:
         """
         url = "/payments/prepare"
         payload = {"merchant_uid": merchant_uid, "amount": amount}
-        return await self._post(url, payload)
+        return await self._post_journaled("prepare", url, payload)
 
     async def prepare_validate(self, merchant_uid: str, amount: float) -> bool:
         """
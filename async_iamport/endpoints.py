@@ -0,0 +1,138 @@
+import asyncio
+import math
+import random
+import time
+from http import HTTPStatus
+from typing import Callable, List, Optional, Sequence
+
+import aiohttp
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+class Endpoint:
+    """
+    one base url with its own connection pool and health statistics
+    """
+
+    def __init__(self, url: str, session: aiohttp.ClientSession) -> None:
+        self.url = url
+        self.session = session
+        # EWMA of response time in seconds, None until the first response
+        self.latency: Optional[float] = None
+        # EWMA of failures, 0 ~ 1
+        self.error_rate = 0.0
+        # monotonic time until which it is skipped after failing
+        self.down_until = 0.0
+        self.failures = 0
+
+    def score(self, error_penalty: float) -> float:
+        """
+        expected response time weighted by error rate, lower is better
+        """
+        if self.latency is None:
+            # try endpoints without statistics first,
+            # unless they have only failed so far
+            return math.inf if self.failures else 0.0
+        return self.latency * (1 + error_penalty * self.error_rate)
+
+    def is_up(self, now: float) -> bool:
+        return self.down_until <= now
+
+
+class EndpointPool:
+    """
+    send each request to the endpoint with the best score, fail over to the
+    next one when it cannot be reached
+
+    a request is sent again to another endpoint only when it surely did not
+    reach the first one (connection refused), or when it is idempotent (or
+    `retriable` is given) and failed by timeout, network error or 5xx.
+    an endpoint failing `max_failures` times in a row is skipped for
+    `cooldown` seconds, one random request in `1 / explore` goes to another
+    endpoint to keep its statistics fresh.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        make_session: Callable[[str], aiohttp.ClientSession],
+        *,
+        alpha: float = 0.2,
+        error_penalty: float = 10.0,
+        max_failures: int = 3,
+        cooldown: float = 5.0,
+        explore: float = 0.02,
+    ) -> None:
+        if not urls:
+            raise ValueError("at least one url is required")
+        self.endpoints = [Endpoint(url, make_session(url)) for url in urls]
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.explore = explore
+
+    def ordered(self) -> List[Endpoint]:
+        """
+        endpoints in the order to try them
+        """
+        now = time.monotonic()
+        up = [endpoint for endpoint in self.endpoints if endpoint.is_up(now)]
+        down = [endpoint for endpoint in self.endpoints if not endpoint.is_up(now)]
+        up.sort(key=lambda endpoint: endpoint.score(self.error_penalty))
+        down.sort(key=lambda endpoint: endpoint.down_until)
+        if len(up) > 1 and random.random() < self.explore:
+            up.insert(0, up.pop(random.randrange(1, len(up))))
+        return up + down
+
+    async def request(
+        self, method: str, url: str, *, retriable: Optional[bool] = None, **kwargs
+    ) -> aiohttp.ClientResponse:
+        """
+        :param retriable: safe to send again, by default only idempotent methods
+        """
+        if retriable is None:
+            retriable = method.upper() in IDEMPOTENT_METHODS
+        endpoints = self.ordered()
+        for i, endpoint in enumerate(endpoints):
+            last = i == len(endpoints) - 1
+            start = time.monotonic()
+            try:
+                response = await endpoint.session.request(method, url, **kwargs)
+            except aiohttp.ClientConnectorError:
+                self.record_failure(endpoint)
+                if last:
+                    raise
+                continue
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                self.record_failure(endpoint)
+                if last or not retriable:
+                    raise
+                continue
+            if response.status >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                self.record_failure(endpoint)
+                if retriable and not last:
+                    response.release()
+                    continue
+                return response
+            self.record_success(endpoint, time.monotonic() - start)
+            return response
+        raise ConnectionError("NO ENDPOINT")
+
+    def record_success(self, endpoint: Endpoint, rtt: float) -> None:
+        if endpoint.latency is None:
+            endpoint.latency = rtt
+        else:
+            endpoint.latency += self.alpha * (rtt - endpoint.latency)
+        endpoint.error_rate *= 1 - self.alpha
+        endpoint.failures = 0
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        endpoint.error_rate += self.alpha * (1 - endpoint.error_rate)
+        endpoint.failures += 1
+        if endpoint.failures >= self.max_failures:
+            endpoint.down_until = time.monotonic() + self.cooldown
+
+    async def close(self) -> None:
+        await asyncio.gather(*(endpoint.session.close() for endpoint in self.endpoints))
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+from .client import HttpError, ResponseError
+
+if TYPE_CHECKING:
+    from .client import AsyncIamport
+
+BEGIN = "begin"
+END = "end"
+
+# card information is never written to the journal
+REDACTED_KEYS = frozenset(
+    ["card_number", "expiry", "birth", "pwd_2digit", "cvc", "card_quota"]
+)
+
+
+class Journal:
+    """
+    append-only write-ahead log of mutating calls
+
+    one json record per line. a `begin` record is made durable before the
+    request is sent, the `end` record is written with the next commit.
+    records appended while an fsync is running are written and synced
+    together by the next one (group commit), so concurrent calls share
+    the cost of fsync. compact() rewrites the log with pending entries only.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[IO[bytes]] = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._buffer: List[bytes] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flusher: Optional[asyncio.Future] = None
+
+    async def begin(self, op: str, payload: Dict[str, Any]) -> str:
+        """
+        durably record a request before it is sent
+
+        :param op: name of the client method
+        :param payload: request payload
+        :return: entry id
+        """
+        entry_id = uuid.uuid4().hex
+        record = {
+            "id": entry_id,
+            "type": BEGIN,
+            "op": op,
+            "payload": {
+                key: "***" if key in REDACTED_KEYS else value
+                for key, value in payload.items()
+            },
+            "ts": time.time(),
+        }
+        await self._append(record)
+        return entry_id
+
+    def end(
+        self,
+        entry_id: str,
+        response: Any = None,
+        error: Optional[Dict[str, Any]] = None,
+        **extra,
+    ) -> None:
+        """
+        record the result of a request, written with the next commit
+        """
+        record = {
+            "id": entry_id,
+            "type": END,
+            "response": response,
+            "ts": time.time(),
+        }
+        if error is not None:
+            record["error"] = error
+        record.update(extra)
+        self._enqueue(record)
+
+    async def flush(self) -> None:
+        """
+        wait until every appended record is durable
+        """
+        if self._buffer or self._flusher is not None:
+            await self._append(None)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._file is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._file.close
+            )
+            self._file = None
+        self._executor.shutdown(wait=False)
+
+    def _enqueue(self, record: Optional[Dict[str, Any]]) -> None:
+        if record is not None:
+            self._buffer.append(
+                json.dumps(record, ensure_ascii=False, default=str).encode() + b"\n"
+            )
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def _append(self, record: Optional[Dict[str, Any]]) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._enqueue(record)
+        await future
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._buffer or self._waiters:
+                lines, self._buffer = self._buffer, []
+                waiters, self._waiters = self._waiters, []
+                try:
+                    await loop.run_in_executor(self._executor, self._write, lines)
+                except Exception as e:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                    continue
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+        finally:
+            self._flusher = None
+
+    def _write(self, lines: List[bytes]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            if self._file.tell() > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # end a line torn by a crash before appending
+                        lines.insert(0, b"\n")
+        if lines:
+            self._file.write(b"".join(lines))
+            self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @staticmethod
+    def read(path: str) -> Iterator[Dict[str, Any]]:
+        """
+        read records, a torn last line from a crash is skipped
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    @classmethod
+    def pending(cls, path: str) -> List[Dict[str, Any]]:
+        """
+        begin records without end record
+        """
+        entries: Dict[str, Dict[str, Any]] = {}
+        for record in cls.read(path):
+            if record.get("type") == BEGIN:
+                entries[record["id"]] = record
+            elif record.get("type") == END:
+                entries.pop(record["id"], None)
+        return list(entries.values())
+
+    async def compact(self) -> None:
+        """
+        drop closed entries, only begin records without end record are kept
+        """
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._compact)
+
+    def _compact(self) -> None:
+        # runs on the writer thread, so no write is in progress
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        pending = self.pending(self.path)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in pending:
+                f.write(
+                    json.dumps(record, ensure_ascii=False, default=str).encode() + b"\n"
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        # the old and the new log are both valid, whichever survives a crash
+        os.replace(tmp_path, self.path)
+
+    async def recover(self, iamport: "AsyncIamport") -> List[Dict[str, Any]]:
+        """
+        reconcile pending entries with iamport after a crash
+
+        every pending entry is looked up (find for payments and cancels,
+        prepared amount for prepare) and closed with what iamport has now,
+        then the log is compacted.
+
+        :return: [{"entry": begin record, "response": current state or None}]
+        """
+        reconciled = []
+        for entry in self.pending(self.path):
+            response = await _lookup(iamport, entry["op"], entry["payload"])
+            self.end(entry["id"], response, recovered=True)
+            reconciled.append({"entry": entry, "response": response})
+        await self.compact()
+        return reconciled
+
+
+async def _lookup(
+    iamport: "AsyncIamport", op: str, payload: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    try:
+        if op == "prepare":
+            return await iamport._get(f"/payments/prepare/{payload['merchant_uid']}")
+        keys = ("imp_uid", "merchant_uid")
+        kwargs = {key: payload[key] for key in keys if key in payload}
+        return await iamport.find(**kwargs)
+    except ResponseError:
+        return None
+    except HttpError as e:
+        if e.code == HTTPStatus.NOT_FOUND:
+            return None
+        raise
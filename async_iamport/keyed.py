@@ -0,0 +1,211 @@
+import asyncio
+import functools
+import itertools
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Tuple,
+)
+
+from .client import ResponseError
+
+if TYPE_CHECKING:
+    from .client import AsyncIamport
+
+_Entry = Tuple[Any, asyncio.Future]
+
+# fields summed or picked when partial cancels are merged,
+# every other field has to be the same
+_MERGED_FIELDS = frozenset(["amount", "tax_free", "vat_amount", "checksum", "reason"])
+_SUMMED_FIELDS = ("amount", "tax_free", "vat_amount")
+
+
+class KeyedExecutor:
+    """
+    run operations one at a time per key, operations of different keys
+    run in parallel
+
+    each key with queued operations has one worker task draining its
+    queue in order, the worker ends when the queue is empty.
+    """
+
+    def __init__(self) -> None:
+        self._queues: Dict[Hashable, Deque[_Entry]] = {}
+        self._workers: Dict[Hashable, asyncio.Future] = {}
+
+    async def submit(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        run func after every operation submitted earlier with the same key
+
+        :param key: e.g. imp_uid
+        :param func: coroutine function without arguments
+        :return: result of func
+        """
+        return await self._enqueue(key, func)
+
+    @property
+    def active_keys(self) -> int:
+        return len(self._queues)
+
+    async def _enqueue(self, key: Hashable, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            worker = self._workers[key] = asyncio.ensure_future(self._drain(key, queue))
+            worker.add_done_callback(functools.partial(self._stopped, key, queue))
+        queue.append((item, future))
+        return await future
+
+    async def _drain(self, key: Hashable, queue: Deque[_Entry]) -> None:
+        batch: List[_Entry] = []
+        try:
+            while queue:
+                batch = self._take(queue)
+                if batch:
+                    await self._execute(batch)
+        except BaseException as e:
+            # worker cancelled or an operation raised CancelledError,
+            # callers of the batch and of the queue must not wait forever
+            self._fail(itertools.chain(batch, queue), e)
+            raise
+        finally:
+            del self._queues[key]
+            del self._workers[key]
+
+    def _stopped(
+        self, key: Hashable, queue: Deque[_Entry], worker: asyncio.Future
+    ) -> None:
+        # a worker cancelled before it started never ran _drain
+        if self._workers.get(key) is worker:
+            del self._queues[key]
+            del self._workers[key]
+            self._fail(queue, asyncio.CancelledError())
+
+    @staticmethod
+    def _fail(entries: Iterable[_Entry], error: BaseException) -> None:
+        for _, future in entries:
+            if not future.done():
+                future.set_exception(error)
+
+    def _take(self, queue: Deque[_Entry]) -> List[_Entry]:
+        """
+        pop the entries to run next, entries of cancelled callers are dropped
+        """
+        entry = queue.popleft()
+        return [] if entry[1].done() else [entry]
+
+    async def _execute(self, batch: List[_Entry]) -> None:
+        for func, future in batch:
+            try:
+                result = await func()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+
+class OrderedCanceller(KeyedExecutor):
+    """
+    cancel payments through iamport.cancel, one request at a time per
+    imp_uid (or merchant_uid when imp_uid is not given)
+
+    with merge=True, partial cancels waiting for the same key are sent as
+    one request: amount, tax_free and vat_amount are summed, checksum of
+    the first one is used and reasons are joined. every merged caller gets
+    the same response. when iamport refuses a merged cancel, its cancels
+    are sent again one by one in order. a full cancel (no amount) is never
+    merged.
+
+    a payment cancelled by imp_uid in one call and by merchant_uid in
+    another is keyed twice, use one of them consistently.
+    """
+
+    def __init__(self, iamport: "AsyncIamport", *, merge: bool = False) -> None:
+        super().__init__()
+        self.iamport = iamport
+        self.merge = merge
+
+    async def cancel(self, reason: str, **kwargs) -> Dict:
+        """
+        cancel payment by merchant_uid or imp_uid
+
+        POST 'IAMPORT_API_URL/payments/cancel'
+
+        :param reason: reason for cancel
+        :param kwargs: keyword arguments
+        :return: result
+        """
+        if kwargs.get("imp_uid"):
+            key: Tuple[str, str] = ("imp_uid", kwargs["imp_uid"])
+        elif kwargs.get("merchant_uid"):
+            key = ("merchant_uid", kwargs["merchant_uid"])
+        else:
+            raise KeyError("merchant_uid or imp_uid is required")
+        return await self._enqueue(key, dict(kwargs, reason=reason))
+
+    def _take(self, queue: Deque[_Entry]) -> List[_Entry]:
+        batch = super()._take(queue)
+        if not batch or not self.merge or "amount" not in batch[0][0]:
+            return batch
+        first = batch[0][0]
+        while queue:
+            payload, future = queue[0]
+            if future.done():
+                queue.popleft()
+                continue
+            if not self._can_merge(first, payload):
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    @staticmethod
+    def _can_merge(first: Dict, payload: Dict) -> bool:
+        if "amount" not in payload:
+            return False
+        for field in _SUMMED_FIELDS:
+            if (field in first) != (field in payload):
+                return False
+        keys = (set(first) | set(payload)) - _MERGED_FIELDS
+        return all(first.get(key) == payload.get(key) for key in keys)
+
+    async def _execute(self, batch: List[_Entry]) -> None:
+        payloads = [payload for payload, _ in batch]
+        payload = dict(payloads[0])
+        if len(payloads) > 1:
+            for field in _SUMMED_FIELDS:
+                if field in payload:
+                    payload[field] = sum(p[field] for p in payloads)
+            reasons = list(dict.fromkeys(p["reason"] for p in payloads))
+            payload["reason"] = ", ".join(reasons)
+        reason = payload.pop("reason")
+        try:
+            result = await self.iamport.cancel(reason, **payload)
+        except ResponseError as e:
+            if len(batch) > 1:
+                # e.g. the sum is over the cancellable amount,
+                # retry one by one to find out which of them go through
+                for entry in batch:
+                    if not entry[1].done():
+                        await self._execute([entry])
+                return
+            if not batch[0][1].done():
+                batch[0][1].set_exception(e)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(result)
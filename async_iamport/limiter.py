@@ -0,0 +1,141 @@
+import asyncio
+import math
+from collections import deque
+from typing import Deque, Optional
+
+DEFAULT_INITIAL_LIMIT = 20
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 100
+
+
+class LimitExceeded(Exception):
+    def __init__(self, limit: int, queued: int) -> None:
+        self.limit = limit
+        self.queued = queued
+
+
+class AdaptiveLimiter:
+    """
+    in-flight request limit adjusted by observed latency
+
+    rtt samples are averaged per window of about `limit` requests.
+    gradient = tolerance * baseline_rtt / window_rtt, clamped to [0.5, 1],
+    where baseline_rtt is a slow average over `long_window` windows.
+    while latency stays near the baseline the limit grows by sqrt(limit)
+    per window, when latency rises it shrinks in proportion, and a dropped
+    request (timeout, connection error, 5xx) cuts it by `backoff`.
+
+    requests over the limit wait in a FIFO queue, when `max_queue` of them
+    are already waiting LimitExceeded is raised instead.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = DEFAULT_INITIAL_LIMIT,
+        *,
+        min_limit: int = DEFAULT_MIN_LIMIT,
+        max_limit: int = DEFAULT_MAX_LIMIT,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        backoff: float = 0.9,
+        max_queue: Optional[int] = None,
+        long_window: int = 600,
+        min_window_size: int = 10,
+    ) -> None:
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("min_limit <= initial_limit <= max_limit is required")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.min_window_size = min_window_size
+        self._long_alpha = 2 / (long_window + 1)
+        self._limit = float(initial_limit)
+        self.in_flight = 0
+        # baseline and last window round trip time in seconds
+        self.long_rtt: Optional[float] = None
+        self.short_rtt: Optional[float] = None
+        self._window_count = 0
+        self._window_rtt = 0.0
+        self._window_in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.limit and not self.queued:
+            self.in_flight += 1
+            return
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            raise LimitExceeded(self.limit, self.queued)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(None)
+            else:
+                future.cancel()
+            raise
+
+    def acquire_nowait(self) -> None:
+        """
+        take a slot without checking the limit,
+        for callers that keep to `limit` on their own
+        """
+        self.in_flight += 1
+
+    def release(self, rtt: Optional[float], dropped: bool = False) -> None:
+        """
+        :param rtt: round trip time in seconds, None when not measured
+        :param dropped: request failed by overload or network
+        """
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if dropped:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        elif rtt is not None:
+            self._window_count += 1
+            self._window_rtt += rtt
+            self._window_in_flight = max(self._window_in_flight, in_flight)
+            if self._window_count >= max(self.min_window_size, self.limit):
+                self._update(
+                    self._window_rtt / self._window_count, self._window_in_flight
+                )
+                self._window_count = self._window_in_flight = 0
+                self._window_rtt = 0.0
+        self._wake_up()
+
+    def _update(self, rtt: float, in_flight: int) -> None:
+        self.short_rtt = rtt
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+            return
+        self.long_rtt += self._long_alpha * (rtt - self.long_rtt)
+        if self.long_rtt / self.short_rtt > 2:
+            # baseline went up during overload, let it come back faster
+            self.long_rtt *= 0.95
+        if in_flight < self._limit / 2:
+            # the limit is not what holds requests back
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        new_limit = self._limit * gradient + math.sqrt(self._limit)
+        self._limit = self._limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self._limit = min(self.max_limit, max(self.min_limit, self._limit))
+
+    def _wake_up(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
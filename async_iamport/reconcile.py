@@ -0,0 +1,169 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .client import AsyncIamport
+
+if TYPE_CHECKING:
+    from multiprocessing.context import BaseContext
+
+DEFAULT_WINDOW = 24 * 60 * 60  # seconds
+PAGE_LIMIT = 100  # max of iamport
+
+
+class _WindowJob(NamedTuple):
+    imp_key: str
+    imp_secret: str
+    imp_url: Union[str, Sequence[str]]
+    time_out: int
+    token: Optional[str]
+    token_expired_at: Optional[float]
+    status: str
+    start: int
+    end: int
+    params: Dict[str, Any]
+    transform: Optional[Callable[[Dict], Any]]
+
+
+def split_windows(start: int, end: int, window: int) -> List[Tuple[int, int]]:
+    """
+    split [start, end] into windows of `window` seconds
+
+    `to` is inclusive in find_by_status, so every window but the last
+    ends a second before the next one starts.
+
+    :param start: unix timestamp
+    :param end: unix timestamp
+    :param window: seconds
+    :return: [(from, to), ...] in time order
+    """
+    if window <= 0:
+        raise ValueError("window must be positive")
+    if start == end:
+        return [(start, end)]
+    return [
+        (t, t + window - 1 if t + window < end else end)
+        for t in range(start, end, window)
+    ]
+
+
+def _sync_window(job: _WindowJob) -> List[Any]:
+    # runs in a worker process with its own event loop and client
+    return asyncio.run(_fetch_window(job))
+
+
+async def _fetch_window(job: _WindowJob) -> List[Any]:
+    iamport = AsyncIamport(
+        imp_key=job.imp_key,
+        imp_secret=job.imp_secret,
+        imp_url=job.imp_url,
+        pool_size=1,
+        time_out=job.time_out,
+    )
+    if job.token is not None:
+        iamport._set_token(job.token, job.token_expired_at, None)
+    records: List[Any] = []
+    params = dict(job.params)
+    params.setdefault("limit", PAGE_LIMIT)
+    params.update({"from": job.start, "to": job.end, "sorting": "started"})
+    page = 1
+    try:
+        while page:
+            response = await iamport.find_by_status(job.status, page=page, **params)
+            payments = response.get("list") or []
+            if job.transform is not None:
+                payments = [job.transform(payment) for payment in payments]
+            records.extend(payments)
+            page = response.get("next") or 0
+    finally:
+        await iamport.close_session()
+    return records
+
+
+class ReconciliationRunner:
+    """
+    sync find_by_status over a long time range on several processes
+
+    the range is split into windows, each window is fetched page by page
+    in a worker process with its own AsyncIamport and event loop, and
+    `transform` (a picklable function, e.g. the comparison with local
+    records) runs there too. the token of the given client is handed to
+    every worker, and results come back as one stream in time order.
+    """
+
+    def __init__(
+        self,
+        iamport: AsyncIamport,
+        *,
+        processes: Optional[int] = None,
+        window: int = DEFAULT_WINDOW,
+        transform: Optional[Callable[[Dict], Any]] = None,
+        mp_context: Optional["BaseContext"] = None,
+    ) -> None:
+        self.iamport = iamport
+        self.processes = processes or os.cpu_count() or 1
+        self.window = window
+        self.transform = transform
+        self.mp_context = mp_context
+
+    async def run(
+        self, status: str, start: int, end: int, **params
+    ) -> AsyncIterator[Any]:
+        """
+        :param status: ["all", "ready", "paid", "cancelled", "failed"]
+        :param start: unix timestamp
+        :param end: unix timestamp
+        :param params: other find_by_status params, sorting is always "started"
+        :return: async iterator of payments (or of what transform returns)
+        """
+        if params.get("sorting", "started") != "started":
+            raise ValueError("results are streamed in started order")
+        iamport = self.iamport
+        await iamport._get_token()
+        jobs = deque(
+            _WindowJob(
+                imp_key=iamport.imp_key,
+                imp_secret=iamport.imp_secret,
+                imp_url=iamport.imp_url,
+                time_out=iamport.time_out,
+                token=iamport.token,
+                token_expired_at=iamport._token_expired_at,
+                status=status,
+                start=window_start,
+                end=window_end,
+                params=params,
+                transform=self.transform,
+            )
+            for window_start, window_end in split_windows(start, end, self.window)
+        )
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(self.processes, mp_context=self.mp_context)
+        # a few windows ahead of the consumer, results are kept in order
+        running: Deque[asyncio.Future] = deque()
+        try:
+            while jobs or running:
+                while jobs and len(running) < self.processes * 2:
+                    running.append(
+                        loop.run_in_executor(pool, _sync_window, jobs.popleft())
+                    )
+                for record in await running.popleft():
+                    yield record
+        finally:
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=False)
@@ -0,0 +1,397 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+import aiohttp
+
+from .client import HttpError, ResponseError
+
+if TYPE_CHECKING:
+    from .client import AsyncIamport
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_LEASE_SECONDS = 300
+
+PAID = "paid"
+FAILED = "failed"
+NO_BILLING_KEY = "no_billing_key"
+# request was sent but its result is not known, e.g. timeout
+UNKNOWN = "unknown"
+
+
+class DueSubscription(NamedTuple):
+    merchant_uid: str
+    customer_uid: str
+    amount: float
+    name: Optional[str] = None
+    # extra pay_again fields
+    extra: Optional[Dict[str, Any]] = None
+    # how many times it was claimed including this one,
+    # above 1 means an earlier claim may have charged it already
+    attempt: int = 1
+
+
+class RenewalResult(NamedTuple):
+    merchant_uid: str
+    status: str
+    imp_uid: Optional[str] = None
+    message: Optional[str] = None
+
+
+class SubscriptionSource(ABC):
+    """
+    where RenewalEngine takes due subscriptions from and records results to
+    """
+
+    @abstractmethod
+    async def claim(
+        self, worker_id: str, limit: int, lease_seconds: float
+    ) -> List[DueSubscription]:
+        """
+        lease up to limit due subscriptions to worker_id
+
+        :return: empty list when nothing is due
+        """
+
+    @abstractmethod
+    async def complete(self, worker_id: str, results: List[RenewalResult]) -> None:
+        """
+        record results of subscriptions leased to worker_id at once
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class IteratorSubscriptionSource(SubscriptionSource):
+    """
+    single node source reading from an async iterable
+
+    there is nothing to share with other workers, so no lease is kept.
+    """
+
+    def __init__(
+        self,
+        subscriptions: AsyncIterable[DueSubscription],
+        on_results: Optional[Callable[[List[RenewalResult]], Awaitable[None]]] = None,
+    ) -> None:
+        self._iterator: AsyncIterator[DueSubscription] = subscriptions.__aiter__()
+        self._on_results = on_results
+        self.results: List[RenewalResult] = []
+
+    async def claim(
+        self, worker_id: str, limit: int, lease_seconds: float
+    ) -> List[DueSubscription]:
+        claimed: List[DueSubscription] = []
+        while len(claimed) < limit:
+            try:
+                claimed.append(await self._iterator.__anext__())
+            except StopAsyncIteration:
+                break
+        return claimed
+
+    async def complete(self, worker_id: str, results: List[RenewalResult]) -> None:
+        if self._on_results is not None:
+            await self._on_results(results)
+        else:
+            self.results.extend(results)
+
+
+class SQLiteSubscriptionSource(SubscriptionSource):
+    """
+    source on a sqlite table shared by processes on one host
+
+    a worker leases rows by writing its id and lease deadline in one
+    write transaction, rows whose lease is over can be claimed again.
+    results are only recorded by the worker still holding the lease.
+    """
+
+    def __init__(self, path: str, table: str = "subscriptions") -> None:
+        if not table.isidentifier():
+            raise ValueError("table must be an identifier")
+        self.path = path
+        self.table = table
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    merchant_uid TEXT PRIMARY KEY,
+                    customer_uid TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    name TEXT,
+                    extra TEXT,
+                    status TEXT NOT NULL DEFAULT 'due',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_until REAL,
+                    imp_uid TEXT,
+                    message TEXT
+                )
+                """
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_status "
+                f"ON {self.table} (status, lease_until)"
+            )
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def add(self, subscriptions: Iterable[DueSubscription]) -> None:
+        """
+        register due subscriptions, already registered merchant_uid is ignored
+        """
+        rows = [
+            (
+                s.merchant_uid,
+                s.customer_uid,
+                s.amount,
+                s.name,
+                None if s.extra is None else json.dumps(s.extra),
+            )
+            for s in subscriptions
+        ]
+        await self._run(self._add, rows)
+
+    def _add(self, rows: List[tuple]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                f"INSERT OR IGNORE INTO {self.table} "
+                f"(merchant_uid, customer_uid, amount, name, extra) "
+                f"VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    async def claim(
+        self, worker_id: str, limit: int, lease_seconds: float
+    ) -> List[DueSubscription]:
+        return await self._run(self._claim, worker_id, limit, lease_seconds)
+
+    def _claim(
+        self, worker_id: str, limit: int, lease_seconds: float
+    ) -> List[DueSubscription]:
+        connection = self._connect()
+        now = time.time()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                f"SELECT merchant_uid, customer_uid, amount, name, extra, attempts "
+                f"FROM {self.table} "
+                f"WHERE status = 'due' "
+                f"OR (status = 'claimed' AND lease_until < ?) "
+                f"ORDER BY merchant_uid LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            connection.executemany(
+                f"UPDATE {self.table} SET status = 'claimed', "
+                f"attempts = attempts + 1, lease_owner = ?, lease_until = ? "
+                f"WHERE merchant_uid = ?",
+                [(worker_id, now + lease_seconds, row[0]) for row in rows],
+            )
+        return [
+            DueSubscription(
+                merchant_uid=merchant_uid,
+                customer_uid=customer_uid,
+                amount=amount,
+                name=name,
+                extra=None if extra is None else json.loads(extra),
+                attempt=attempts + 1,
+            )
+            for merchant_uid, customer_uid, amount, name, extra, attempts in rows
+        ]
+
+    async def complete(self, worker_id: str, results: List[RenewalResult]) -> None:
+        await self._run(self._complete, worker_id, results)
+
+    def _complete(self, worker_id: str, results: List[RenewalResult]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                f"UPDATE {self.table} SET status = ?, imp_uid = ?, message = ?, "
+                f"lease_owner = NULL, lease_until = NULL "
+                f"WHERE merchant_uid = ? AND lease_owner = ?",
+                [
+                    (
+                        result.status,
+                        result.imp_uid,
+                        result.message,
+                        result.merchant_uid,
+                        worker_id,
+                    )
+                    for result in results
+                    # unknown results stay leased until the lease is over,
+                    # next claim checks iamport before charging again
+                    if result.status != UNKNOWN
+                ],
+            )
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=False)
+
+
+class RenewalEngine:
+    """
+    charge due subscriptions with pay_again
+
+    each worker claims a batch from the source, checks billing keys with
+    customer_get_many, charges at most `concurrency` subscriptions at once
+    and records the whole batch in one call. run the same engine in as
+    many processes or nodes as needed against one shared source.
+
+    a subscription claimed again after an earlier attempt is looked up
+    with find_by_merchant_uid first, so a charge that went through before
+    a crash is recorded instead of being charged twice.
+    """
+
+    def __init__(
+        self,
+        iamport: "AsyncIamport",
+        source: SubscriptionSource,
+        *,
+        worker_id: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        check_billing_key: bool = True,
+    ) -> None:
+        self.iamport = iamport
+        self.source = source
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.check_billing_key = check_billing_key
+
+    async def run(self) -> int:
+        """
+        process batches until nothing is due
+
+        :return: number of processed subscriptions
+        """
+        total = 0
+        while True:
+            count = await self.run_once()
+            if count == 0:
+                return total
+            total += count
+
+    async def run_once(self) -> int:
+        """
+        claim and process one batch
+
+        :return: number of processed subscriptions
+        """
+        subscriptions = await self.source.claim(
+            self.worker_id, self.batch_size, self.lease_seconds
+        )
+        if not subscriptions:
+            return 0
+
+        billing_keys: Dict[str, Optional[Dict]] = {}
+        if self.check_billing_key:
+            billing_keys = await self.iamport.customer_get_many(
+                [s.customer_uid for s in subscriptions]
+            )
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(subscription: DueSubscription) -> RenewalResult:
+            if (
+                self.check_billing_key
+                and billing_keys.get(subscription.customer_uid) is None
+            ):
+                return RenewalResult(subscription.merchant_uid, NO_BILLING_KEY)
+            async with semaphore:
+                try:
+                    return await self._renew(subscription)
+                except Exception as e:
+                    # one broken subscription must not keep the batch
+                    # from being recorded
+                    return RenewalResult(
+                        subscription.merchant_uid, UNKNOWN, message=repr(e)
+                    )
+
+        results = await asyncio.gather(*(process(s) for s in subscriptions))
+        await self.source.complete(self.worker_id, list(results))
+        return len(results)
+
+    async def _renew(self, subscription: DueSubscription) -> RenewalResult:
+        if subscription.attempt > 1:
+            try:
+                payment = await self.iamport.find_by_merchant_uid(
+                    subscription.merchant_uid
+                )
+            except HttpError as e:
+                if e.code != HTTPStatus.NOT_FOUND:
+                    return RenewalResult(subscription.merchant_uid, UNKNOWN)
+            except (ResponseError, asyncio.TimeoutError, aiohttp.ClientError, OSError):
+                return RenewalResult(subscription.merchant_uid, UNKNOWN)
+            else:
+                if payment and payment.get("status") == PAID:
+                    return self._result(subscription, payment)
+
+        payload = dict(subscription.extra or {})
+        payload.update(
+            merchant_uid=subscription.merchant_uid,
+            customer_uid=subscription.customer_uid,
+            amount=subscription.amount,
+        )
+        if subscription.name is not None:
+            payload["name"] = subscription.name
+        try:
+            payment = await self.iamport.pay_again(**payload)
+        except ResponseError as e:
+            return RenewalResult(subscription.merchant_uid, FAILED, message=e.message)
+        except Exception as e:
+            return RenewalResult(subscription.merchant_uid, UNKNOWN, message=repr(e))
+        return self._result(subscription, payment)
+
+    @staticmethod
+    def _result(subscription: DueSubscription, payment: Dict) -> RenewalResult:
+        if payment.get("status") == PAID:
+            return RenewalResult(
+                subscription.merchant_uid, PAID, imp_uid=payment.get("imp_uid")
+            )
+        return RenewalResult(
+            subscription.merchant_uid,
+            FAILED,
+            imp_uid=payment.get("imp_uid"),
+            message=payment.get("fail_reason"),
+        )
@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Iterator, List, Tuple
+
+
+class Priority(IntEnum):
+    """
+    lower value runs first
+    """
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+current_priority: ContextVar[Priority] = ContextVar(
+    "iamport_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def priority(value: Priority) -> Iterator[None]:
+    """
+    run calls inside the block with the given priority
+
+    with priority(Priority.BACKGROUND):
+        await iamport.find_by_status("paid")
+    """
+    token = current_priority.set(value)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class PriorityScheduler:
+    """
+    hand out request slots by priority
+
+    INTERACTIVE calls may use every slot and always go ahead of waiting
+    lower priority calls. lower priorities only use slots left over after
+    `reserved` slots are kept free for INTERACTIVE calls. when capacity
+    shrinks to `reserved` or below, lower priorities still get one slot.
+    """
+
+    def __init__(self, capacity: int, reserved: int = 0) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        if not 0 <= reserved < capacity:
+            raise ValueError("reserved must be in [0, capacity)")
+        self.capacity = capacity
+        self.reserved = reserved
+        self.in_use = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    def _has_room(self, priority: int) -> bool:
+        if priority <= Priority.INTERACTIVE:
+            return self.in_use < self.capacity
+        return self.in_use < max(self.capacity - self.reserved, 1)
+
+    def can_acquire(self, priority: int = Priority.INTERACTIVE) -> bool:
+        """
+        whether acquire(priority) gets a slot without waiting
+        """
+        self._wake_up()
+        return self._has_room(priority) and (
+            not self._waiters or self._waiters[0][0] > priority
+        )
+
+    async def acquire(self, priority: int = Priority.INTERACTIVE) -> None:
+        if self.can_acquire(priority):
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was handed over right before cancellation
+                self.release()
+            else:
+                future.cancel()
+                self._wake_up()
+            raise
+
+    def resize(self, capacity: int) -> None:
+        """
+        change capacity, slots already in use are kept
+
+        capacity is not raised to keep reserved slots, so a limit set from
+        outside (e.g. AdaptiveLimiter) is never exceeded
+        """
+        self.capacity = max(capacity, 1)
+        self._wake_up()
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_room(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.in_use += 1
+            future.set_result(None)
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def waiting_ahead(self, priority: int) -> int:
+        """
+        waiting calls that get a slot before a new call of the given priority
+        """
+        return sum(
+            1
+            for waiter_priority, _, future in self._waiters
+            if waiter_priority <= priority and not future.done()
+        )
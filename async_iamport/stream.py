@@ -0,0 +1,198 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .client import ResponseError
+
+WHITESPACE = " \t\n\r"
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+# parser states
+_START = 0
+_TOP_KEY = 1
+_TOP_VALUE = 2
+_RESPONSE_KEY = 3
+_RESPONSE_VALUE = 4
+_LIST_ITEM = 5
+_DONE = 6
+
+
+class ListParser:
+    """
+    incremental parser of {"code": .., "message": .., "response": {"list": [..]}}
+
+    feed() takes text as it arrives and returns list items completed so far,
+    so only the unparsed tail and one item at a time are kept in memory.
+    other keys of the envelope and of response are kept in
+    `envelope` and `meta`. a response which is a list itself works too.
+    """
+
+    def __init__(self) -> None:
+        self.envelope: Dict[str, Any] = {}
+        self.meta: Dict[str, Any] = {}
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._key: Optional[str] = None
+        # list items end at "]" of response or of response.list
+        self._list_in_response = True
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> List[Any]:
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        items: List[Any] = []
+        while self._state != _DONE and self._step(items):
+            pass
+        return items
+
+    def _skip(self) -> Optional[str]:
+        """
+        skip whitespace, return next char or None when more text is needed
+        """
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and buffer[pos] in WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buffer[pos] if pos < len(buffer) else None
+
+    def _value(self) -> Any:
+        """
+        decode one complete value, raise IndexError when more text is needed
+        """
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except ValueError:
+            raise IndexError
+        # a number at the very end may be cut, every valid document
+        # has at least a closing bracket after a value
+        if end >= len(self._buffer):
+            raise IndexError
+        # so may one cut before its fraction or exponent, e.g. "2" of "2.5"
+        if type(value) in (int, float) and self._buffer[end] in ".eE":
+            raise IndexError
+        self._pos = end
+        return value
+
+    def _key_colon(self) -> Optional[str]:
+        start = self._pos
+        key = self._value()
+        if self._skip() != ":":
+            self._pos = start
+            raise IndexError
+        self._pos += 1
+        return key
+
+    def _step(self, items: List[Any]) -> bool:
+        char = self._skip()
+        if char is None:
+            return False
+        start = self._pos
+        try:
+            if self._state == _START:
+                self._expect(char, "{")
+                self._state = _TOP_KEY
+            elif self._state == _TOP_KEY:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    self._key = self._key_colon()
+                    self._state = _TOP_VALUE
+            elif self._state == _TOP_VALUE:
+                if self._key == "response" and char in "{[":
+                    self._pos += 1
+                    if char == "{":
+                        self._state = _RESPONSE_KEY
+                    else:
+                        self._list_in_response = False
+                        self._state = _LIST_ITEM
+                else:
+                    self.envelope[self._key] = self._value()  # type: ignore
+                    self._state = _TOP_KEY
+            elif self._state == _RESPONSE_KEY:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _TOP_KEY
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    self._key = self._key_colon()
+                    self._state = _RESPONSE_VALUE
+            elif self._state == _RESPONSE_VALUE:
+                if self._key == "list" and char == "[":
+                    self._pos += 1
+                    self._state = _LIST_ITEM
+                else:
+                    self.meta[self._key] = self._value()  # type: ignore
+                    self._state = _RESPONSE_KEY
+            elif self._state == _LIST_ITEM:
+                if char == "]":
+                    self._pos += 1
+                    self._state = _RESPONSE_KEY if self._list_in_response else _TOP_KEY
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    items.append(self._value())
+        except IndexError:
+            self._pos = start
+            return False
+        return True
+
+    def _expect(self, char: str, expected: str) -> None:
+        if char != expected:
+            raise ValueError(f"unexpected {char!r} at {self._pos}")
+        self._pos += 1
+
+
+def check_envelope(envelope: Dict[str, Any]) -> None:
+    code = envelope.get("code")
+    if code != 0:
+        raise ResponseError(code, envelope.get("message"))  # type: ignore
+
+
+async def iter_response_list(
+    response, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    yield items of response.list (or of response when it is a list)
+    while the body is still being read
+
+    items are held back only until "code" of the envelope is read,
+    it comes first in iamport responses. for a non-zero code the error
+    is raised once "message" (or the end of the body) is read.
+    """
+    parser = ListParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    held: List[Any] = []
+    checked = False
+    async for chunk in response.content.iter_chunked(chunk_size):
+        items = parser.feed(decoder.decode(chunk))
+        envelope = parser.envelope
+        if (
+            not checked
+            and "code" in envelope
+            and (envelope["code"] == 0 or "message" in envelope)
+        ):
+            check_envelope(envelope)
+            checked = True
+            items, held = held + items, []
+        if not checked:
+            held.extend(items)
+            continue
+        for item in items:
+            yield item
+    items = parser.feed(decoder.decode(b"", final=True))
+    if not parser.done:
+        raise ValueError("response body ended in the middle")
+    check_envelope(parser.envelope)
+    for item in held + items:
+        yield item
@@ -0,0 +1,108 @@
+"""
+per-call overhead of AsyncIamport with networking stubbed out
+
+python benchmarks/bench_client.py [--calls N]
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from async_iamport import AsyncIamport  # noqa: E402
+
+PAYMENT = {"imp_uid": "imp_1234", "merchant_uid": "1234qwer", "amount": 1000}
+
+
+class StubResponse:
+    status = 200
+    reason = "OK"
+
+    def __init__(self, body):
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+
+class StubSession:
+    def __init__(self):
+        self._token = StubResponse(
+            {
+                "code": 0,
+                "response": {
+                    "access_token": "token",
+                    "expired_at": int(time.time()) + 1800,
+                    "now": int(time.time()),
+                },
+            }
+        )
+        self._payment = StubResponse({"code": 0, "response": PAYMENT})
+
+    async def request(self, method, url, **kwargs):
+        if url == "/users/getToken":
+            return self._token
+        return self._payment
+
+    async def close(self):
+        pass
+
+
+async def make_client(**kwargs) -> AsyncIamport:
+    client = AsyncIamport(imp_key="imp_apikey", imp_secret="secret", **kwargs)
+    await client.close_session()
+    client.session = StubSession()  # type: ignore
+    await client._get_token()
+    return client
+
+
+async def measure(name, call, calls):
+    for _ in range(min(calls, 1000)):
+        await call()
+    start = time.perf_counter()
+    for _ in range(calls):
+        await call()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / calls * 1e6:8.2f} us/call")
+
+
+async def main(calls: int) -> None:
+    client = await make_client()
+    await measure("_get_token (fresh)", client._get_token, calls)
+    await measure("find_by_imp_uid", lambda: client.find_by_imp_uid("imp_1234"), calls)
+    await measure("prepare", lambda: client.prepare("1234qwer", 1000), calls)
+    await measure(
+        "is_paid",
+        lambda: client.is_paid(1000, merchant_uid="1234qwer"),
+        calls,
+    )
+
+    scheduled = await make_client(reserved_interactive=10)
+    await measure(
+        "find_by_imp_uid (priority scheduler)",
+        lambda: scheduled.find_by_imp_uid("imp_1234"),
+        calls,
+    )
+
+
+def import_time() -> float:
+    code = (
+        "import time; t = time.perf_counter(); import async_iamport; "
+        "print(time.perf_counter() - t)"
+    )
+    root = Path(__file__).resolve().parent.parent
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=root, capture_output=True, text=True
+    )
+    return float(out.stdout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+    print(f"{'import async_iamport':<40} {import_time() * 1e3:8.2f} ms")
+    asyncio.run(main(args.calls))
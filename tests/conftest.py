@@ -1,7 +1,10 @@
 import asyncio
+import time
 
 import pytest
 import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from pytest import fixture
 
 from async_iamport import AsyncIamport
@@ -41,3 +44,68 @@ async def iamport(request):
     # client.get_session()
     yield client
     await client.close_session()
+
+
+def ok(response):
+    return web.json_response({"code": 0, "message": None, "response": response})
+
+
+def fail(code, message):
+    return web.json_response({"code": code, "message": message, "response": None})
+
+
+async def get_token(request):
+    now = int(time.time())
+    return ok({"access_token": "token", "expired_at": now + 1800, "now": now})
+
+
+class StandIn:
+    """
+    local servers standing in for iamport, closed with their clients
+    """
+
+    ok = staticmethod(ok)
+    fail = staticmethod(fail)
+
+    def __init__(self):
+        self.servers = []
+        self.clients = []
+
+    async def start(self, routes):
+        """
+        :param routes: {("GET", "/payments/{imp_uid}"): handler, ...},
+            getToken is answered with a token unless it is given
+        :return: started TestServer
+        """
+        app = web.Application()
+        routes = dict(routes)
+        routes.setdefault(("POST", "/users/getToken"), get_token)
+        for (method, path), handler in routes.items():
+            app.router.add_route(method, path, handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.servers.append(server)
+        return server
+
+    def client(self, *servers, **kwargs):
+        """
+        AsyncIamport sending to the given servers
+        """
+        urls = [str(server.make_url("")) for server in servers]
+        kwargs.setdefault("imp_url", urls[0] if len(urls) == 1 else urls)
+        client = AsyncIamport(imp_key="imp_apikey", imp_secret="secret", **kwargs)
+        self.clients.append(client)
+        return client
+
+    async def close(self):
+        for client in self.clients:
+            await client.close_session()
+        for server in self.servers:
+            await server.close()
+
+
+@pytest_asyncio.fixture
+async def stand_in():
+    stand_in = StandIn()
+    yield stand_in
+    await stand_in.close()
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import async_iamport
+
+
+@pytest.mark.asyncio
+async def test_customer_get_many(iamport):
+    customer_uids = ["000000", "000001", "000002"]
+    result = await iamport.customer_get_many(customer_uids, chunk_size=2)
+    assert list(result) == customer_uids
+    for customer_uid, customer in result.items():
+        assert customer is None or customer["customer_uid"] == customer_uid
+
+
+def customer_routes(stand_in, registered, calls):
+    in_flight = {"now": 0, "max": 0}
+
+    async def customers(request):
+        customer_uids = request.query.getall("customer_uid[]")
+        calls.append(customer_uids)
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if not set(customer_uids) <= registered:
+            # the whole request is refused when one is not registered
+            return web.json_response(
+                {"code": 1, "message": "not found", "response": None}, status=404
+            )
+        return stand_in.ok([{"customer_uid": uid} for uid in customer_uids])
+
+    async def customer(request):
+        customer_uid = request.match_info["customer_uid"]
+        calls.append(customer_uid)
+        if customer_uid not in registered:
+            return stand_in.fail(1, "not found")
+        return stand_in.ok({"customer_uid": customer_uid})
+
+    routes = {
+        ("GET", "/subscribe/customers"): customers,
+        ("GET", "/subscribe/customers/{customer_uid}"): customer,
+    }
+    return routes, in_flight
+
+
+@pytest.mark.asyncio
+async def test_customer_get_many_with_partial_miss(stand_in):
+    customer_uids = ["c%s" % i for i in range(10)]
+    registered = set(customer_uids) - {"c4"}
+    calls = []
+    routes, in_flight = customer_routes(stand_in, registered, calls)
+    iamport = stand_in.client(await stand_in.start(routes))
+
+    result = await iamport.customer_get_many(
+        customer_uids + ["c0"], chunk_size=3, concurrency=2
+    )
+
+    assert list(result) == customer_uids
+    assert result["c4"] is None
+    for customer_uid in registered:
+        assert result[customer_uid] == {"customer_uid": customer_uid}
+    assert [len(call) for call in calls if isinstance(call, list)] == [3, 3, 3, 1]
+    # only the refused chunk is queried one by one
+    assert [call for call in calls if isinstance(call, str)] == ["c3", "c4", "c5"]
+    assert in_flight["max"] == 2
+
+
+@pytest.mark.asyncio
+async def test_customer_get_many_raises_on_server_error(stand_in):
+    async def customers(request):
+        return web.json_response({}, status=500)
+
+    iamport = stand_in.client(
+        await stand_in.start({("GET", "/subscribe/customers"): customers})
+    )
+    with pytest.raises(async_iamport.HttpError):
+        await iamport.customer_get_many(["c0", "c1"])
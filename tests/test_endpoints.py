@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from async_iamport import EndpointPool
+
+
+def stand_in_routes(stand_in, delay, calls, token_delay=0.0):
+    async def get_token(request):
+        calls.append(request.path)
+        await asyncio.sleep(token_delay)
+        now = int(time.time())
+        return stand_in.ok({"access_token": "token", "expired_at": now + 1800})
+
+    async def find_by_imp_uid(request):
+        calls.append(request.path)
+        await asyncio.sleep(delay)
+        payment = {"imp_uid": request.match_info["imp_uid"], "status": "paid"}
+        return stand_in.ok(payment)
+
+    return {
+        ("POST", "/users/getToken"): get_token,
+        ("GET", "/payments/{imp_uid}"): find_by_imp_uid,
+    }
+
+
+@pytest.mark.asyncio
+async def test_fastest_endpoint_is_preferred_and_failed_over(stand_in):
+    """
+    given
+        client with an unreachable url and two stand-in servers, slow and fast
+    when
+        requests are sent, then the fast server goes down
+    then
+        most requests go to the fast server, then to the slow one
+    """
+    slow_calls, fast_calls = [], []
+    slow = await stand_in.start(stand_in_routes(stand_in, 0.03, slow_calls))
+    fast = await stand_in.start(stand_in_routes(stand_in, 0.0, fast_calls))
+    client = stand_in.client(
+        imp_url=[
+            "http://127.0.0.1:1",
+            str(slow.make_url("")),
+            str(fast.make_url("")),
+        ],
+    )
+    for _ in range(50):
+        await client.find_by_imp_uid("imp_1234")
+    assert len(fast_calls) > 40
+
+    await fast.close()
+    slow_calls.clear()
+    for _ in range(10):
+        await client.find_by_imp_uid("imp_1234")
+    assert len(slow_calls) == 10
+
+
+def test_failed_endpoint_without_latency_goes_last():
+    pool = EndpointPool(["a", "b", "c"], lambda url: None, explore=0)
+    pool.record_failure(pool.endpoints[0])
+    pool.record_success(pool.endpoints[1], 0.05)
+
+    assert [endpoint.url for endpoint in pool.ordered()] == ["c", "b", "a"]
+
+
+@pytest.mark.asyncio
+async def test_get_token_fails_over_on_timeout(stand_in):
+    hanging_calls, calls = [], []
+    hanging = await stand_in.start(
+        stand_in_routes(stand_in, 0.0, hanging_calls, token_delay=5)
+    )
+    server = await stand_in.start(stand_in_routes(stand_in, 0.0, calls))
+    client = stand_in.client(hanging, server, time_out=1)
+
+    await client.find_by_imp_uid("imp_1234")
+    assert hanging_calls == ["/users/getToken"]
+    assert calls == ["/users/getToken", "/payments/imp_1234"]
@@ -0,0 +1,81 @@
+import pytest
+
+import async_iamport
+from async_iamport import Journal
+
+
+@pytest.mark.asyncio
+async def test_journal_pending_entry(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    done = await journal.begin("pay_again", {"merchant_uid": "done"})
+    await journal.begin("pay_again", {"merchant_uid": "pending"})
+    journal.end(done, {"status": "paid"})
+    await journal.close()
+
+    # torn last line from a crash
+    with open(path, "ab") as f:
+        f.write(b'{"id": "torn"')
+
+    (pending,) = Journal.pending(path)
+    assert pending["payload"] == {"merchant_uid": "pending"}
+
+
+@pytest.mark.asyncio
+async def test_journal_redacts_card_information(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    await journal.begin("pay_onetime", {"merchant_uid": "1", "card_number": "1234"})
+    await journal.close()
+
+    (record,) = Journal.read(path)
+    assert record["payload"]["card_number"] == "***"
+
+
+@pytest.mark.asyncio
+async def test_journaled_cancel(iamport, tmp_path):
+    path = str(tmp_path / "journal.log")
+    iamport.journal = Journal(path)
+    try:
+        with pytest.raises(async_iamport.ResponseError):
+            await iamport.cancel("test", merchant_uid="journal_cancel")
+        await iamport.journal.close()
+    finally:
+        iamport.journal = None
+
+    assert [] == Journal.pending(path)
+
+
+@pytest.mark.asyncio
+async def test_journal_compact(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    done = await journal.begin("pay_again", {"merchant_uid": "done"})
+    await journal.begin("pay_again", {"merchant_uid": "pending"})
+    journal.end(done, {"status": "paid"})
+    await journal.compact()
+    # appending goes on after compaction
+    await journal.begin("cancel", {"merchant_uid": "next"})
+    await journal.close()
+
+    records = list(Journal.read(path))
+    assert [r["payload"]["merchant_uid"] for r in records] == ["pending", "next"]
+
+
+class FoundIamport:
+    async def find(self, **kwargs):
+        return {"merchant_uid": kwargs["merchant_uid"], "status": "paid"}
+
+
+@pytest.mark.asyncio
+async def test_journal_recover(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    await journal.begin("pay_again", {"merchant_uid": "pending"})
+
+    (recovered,) = await journal.recover(FoundIamport())
+    await journal.close()
+
+    assert recovered["response"]["status"] == "paid"
+    assert [] == Journal.pending(path)
+    assert [] == list(Journal.read(path))
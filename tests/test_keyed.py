@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+import async_iamport
+from async_iamport import KeyedExecutor, OrderedCanceller
+
+
+@pytest.mark.asyncio
+async def test_same_key_runs_in_order_other_keys_in_parallel():
+    executor = KeyedExecutor()
+    running = {"a": 0, "b": 0}
+    overlapped = []
+
+    async def operation(key):
+        running[key] += 1
+        overlapped.append(dict(running))
+        await asyncio.sleep(0.01)
+        running[key] -= 1
+        return key
+
+    results = await asyncio.gather(
+        *(executor.submit(key, lambda key=key: operation(key)) for key in "abab")
+    )
+
+    assert results == ["a", "b", "a", "b"]
+    assert all(counts["a"] <= 1 and counts["b"] <= 1 for counts in overlapped)
+    assert {"a": 1, "b": 1} in overlapped
+    assert executor.active_keys == 0
+
+
+def test_partial_cancels_are_merged():
+    canceller = OrderedCanceller(None, merge=True)
+    first = {"imp_uid": "imp_1", "amount": 100, "checksum": 1000, "reason": "a"}
+    assert canceller._can_merge(
+        first, {"imp_uid": "imp_1", "amount": 200, "reason": "b"}
+    )
+    assert not canceller._can_merge(first, {"imp_uid": "imp_1", "reason": "full"})
+    assert not canceller._can_merge(
+        first, {"imp_uid": "imp_1", "amount": 200, "refund_holder": "홍길동"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_ordered_cancel(iamport):
+    canceller = OrderedCanceller(iamport, merge=True)
+    results = await asyncio.gather(
+        canceller.cancel("test", imp_uid="imp_000000000000", amount=100),
+        canceller.cancel("test", imp_uid="imp_000000000000", amount=100),
+        return_exceptions=True,
+    )
+    for result in results:
+        assert isinstance(result, async_iamport.ResponseError)
+
+
+class StubIamport:
+    def __init__(self, cancellable):
+        self.cancellable = cancellable
+        self.amounts = []
+
+    async def cancel(self, reason, **kwargs):
+        self.amounts.append(kwargs["amount"])
+        if kwargs["amount"] > self.cancellable:
+            raise async_iamport.ResponseError(1, "over the cancellable amount")
+        self.cancellable -= kwargs["amount"]
+        return {"cancel_amount": kwargs["amount"]}
+
+
+@pytest.mark.asyncio
+async def test_refused_merged_cancel_is_retried_one_by_one():
+    iamport = StubIamport(cancellable=250)
+    canceller = OrderedCanceller(iamport, merge=True)
+    results = await asyncio.gather(
+        *(canceller.cancel("test", imp_uid="imp_1", amount=100) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert iamport.amounts == [300, 100, 100, 100]
+    assert results[:2] == [{"cancel_amount": 100}, {"cancel_amount": 100}]
+    assert isinstance(results[2], async_iamport.ResponseError)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_operation_does_not_hang_queue():
+    executor = KeyedExecutor()
+
+    async def cancelled():
+        raise asyncio.CancelledError
+
+    async def never_run():
+        raise AssertionError("runs after the worker stopped")
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            executor.submit("a", cancelled),
+            executor.submit("a", never_run),
+            return_exceptions=True,
+        ),
+        1,
+    )
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert executor.active_keys == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_worker_does_not_hang_callers():
+    canceller = OrderedCanceller(StubIamport(cancellable=1000), merge=False)
+    calls = [
+        asyncio.ensure_future(canceller.cancel("test", imp_uid="imp_1", amount=100))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    canceller._workers[("imp_uid", "imp_1")].cancel()
+
+    results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_worker_cancelled_while_running():
+    executor = KeyedExecutor()
+    calls = [
+        asyncio.ensure_future(executor.submit("a", lambda: asyncio.sleep(1)))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0.01)
+    executor._workers["a"].cancel()
+
+    results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert executor.active_keys == 0
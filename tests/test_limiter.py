@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from async_iamport import AdaptiveLimiter, AsyncIamport, LimitExceeded, Priority
+
+
+async def run_requests(limiter, rounds, rtt):
+    for _ in range(rounds):
+        in_flight = limiter.limit
+        for _ in range(in_flight):
+            await limiter.acquire()
+        for _ in range(in_flight):
+            limiter.release(rtt(in_flight))
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_while_latency_is_flat():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=50)
+    await run_requests(limiter, 100, lambda in_flight: 0.01)
+    assert limiter.limit == 50
+
+
+@pytest.mark.asyncio
+async def test_limit_settles_when_latency_rises():
+    """
+    given
+        server handling 10 requests at once, the rest queued up
+    when
+        many requests are sent
+    then
+        limit settles around what the server can handle
+    """
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=100)
+    await run_requests(limiter, 300, lambda in_flight: 0.01 * max(1, in_flight / 10))
+    assert 10 <= limiter.limit < 50
+
+
+@pytest.mark.asyncio
+async def test_limit_cut_on_drop():
+    limiter = AdaptiveLimiter(initial_limit=10)
+    await limiter.acquire()
+    limiter.release(None, dropped=True)
+    assert limiter.limit == 9
+
+
+@pytest.mark.asyncio
+async def test_excess_requests_are_shed():
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=1)
+    await limiter.acquire()
+    waiting = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(LimitExceeded):
+        await limiter.acquire()
+
+    limiter.release(0.01)
+    await waiting
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_excess_requests_are_shed_with_scheduler():
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=1)
+    iamport = AsyncIamport(
+        imp_key="imp_apikey",
+        imp_secret="secret",
+        pool_size=4,
+        reserved_interactive=2,
+        limiter=limiter,
+    )
+    try:
+        await iamport._acquire_slot()
+        waiting = asyncio.ensure_future(iamport._acquire_slot())
+        await asyncio.sleep(0)
+
+        with pytest.raises(LimitExceeded):
+            await iamport._acquire_slot()
+
+        iamport._release_slot(0.01, False)
+        await waiting
+        assert limiter.in_flight == 1
+    finally:
+        await iamport.close_session()
+
+
+@pytest.mark.asyncio
+async def test_interactive_is_not_shed_behind_background():
+    """
+    given
+        every slot in use and max_queue background calls waiting
+    when
+        interactive call comes
+    then
+        it waits instead of being shed, and goes ahead of background calls
+    """
+    limiter = AdaptiveLimiter(initial_limit=4, max_queue=2)
+    iamport = AsyncIamport(
+        imp_key="imp_apikey",
+        imp_secret="secret",
+        pool_size=4,
+        reserved_interactive=1,
+        limiter=limiter,
+    )
+    try:
+        with iamport.priority(Priority.BACKGROUND):
+            for _ in range(3):
+                await iamport._acquire_slot()
+            background = [
+                asyncio.ensure_future(iamport._acquire_slot()) for _ in range(2)
+            ]
+        await iamport._acquire_slot()
+        await asyncio.sleep(0)
+
+        interactive = asyncio.ensure_future(iamport._acquire_slot())
+        await asyncio.sleep(0)
+        assert not interactive.done()
+
+        with iamport.priority(Priority.BACKGROUND):
+            with pytest.raises(LimitExceeded):
+                await iamport._acquire_slot()
+
+        iamport._release_slot(0.01, False)
+        await interactive
+        assert not any(future.done() for future in background)
+        for future in background:
+            future.cancel()
+    finally:
+        await iamport.close_session()
@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+import async_iamport
+from async_iamport import ResponseError, ScheduleBatcher
+
+
+@pytest.mark.asyncio
+async def test_pay_schedule_batch(iamport):
+    batcher = async_iamport.ScheduleBatcher(iamport, max_delay=0.1)
+    schedule_at = int(time.time() + 1000)
+    payloads = [
+        {
+            "customer_uid": "00000000",
+            "schedules": [
+                {
+                    "merchant_uid": "pay_schedule_batch_%s_%s" % (i, time.time()),
+                    "schedule_at": schedule_at,
+                    "amount": 5000,
+                },
+            ],
+        }
+        for i in range(3)
+    ]
+
+    results = await asyncio.gather(
+        *(batcher.pay_schedule(**payload) for payload in payloads),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, async_iamport.ResponseError):
+            assert result.code == 1
+            assert "등록된 고객정보가 없습니다." in result.message
+        else:
+            assert len(result) == 1
+
+
+@pytest.mark.asyncio
+async def test_pay_unschedule_batch(iamport):
+    batcher = async_iamport.ScheduleBatcher(iamport, max_delay=0.1)
+    payloads = [
+        {
+            "customer_uid": "00000000",
+            "merchant_uid": "pay_unschedule_batch_%s_%s" % (i, time.time()),
+        }
+        for i in range(3)
+    ]
+
+    results = await asyncio.gather(
+        *(batcher.pay_unschedule(**payload) for payload in payloads),
+        return_exceptions=True,
+    )
+    for result in results:
+        assert isinstance(result, async_iamport.ResponseError)
+        assert result.code == 1
+
+
+def schedule_routes(stand_in, requests):
+    async def schedule(request):
+        body = await request.json()
+        requests.append(body)
+        if any(s["merchant_uid"].startswith("bad") for s in body["schedules"]):
+            return stand_in.fail(1, "bad")
+        if any(s["merchant_uid"].startswith("invalid") for s in body["schedules"]):
+            return web.json_response({}, status=400)
+        return stand_in.ok(
+            [dict(s, customer_uid=body["customer_uid"]) for s in body["schedules"]]
+        )
+
+    async def unschedule(request):
+        body = await request.json()
+        requests.append(body)
+        return stand_in.ok(
+            [
+                {"merchant_uid": merchant_uid, "customer_uid": body["customer_uid"]}
+                for merchant_uid in body["merchant_uid"]
+            ]
+        )
+
+    return {
+        ("POST", "/subscribe/payments/schedule"): schedule,
+        ("POST", "/subscribe/payments/unschedule"): unschedule,
+    }
+
+
+async def stand_in_batcher(stand_in, **kwargs):
+    requests = []
+    server = await stand_in.start(schedule_routes(stand_in, requests))
+    return ScheduleBatcher(stand_in.client(server), **kwargs), requests
+
+
+def schedules(*merchant_uids):
+    return [
+        {"merchant_uid": m, "schedule_at": 0, "amount": 1000} for m in merchant_uids
+    ]
+
+
+@pytest.mark.asyncio
+async def test_calls_are_merged_and_results_routed(stand_in):
+    batcher, requests = await stand_in_batcher(stand_in, max_delay=0.05)
+
+    first, second = await asyncio.gather(
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m1", "m2")),
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m3")),
+    )
+
+    assert len(requests) == 1
+    assert [s["merchant_uid"] for s in requests[0]["schedules"]] == ["m1", "m2", "m3"]
+    assert [s["merchant_uid"] for s in first] == ["m1", "m2"]
+    assert [s["merchant_uid"] for s in second] == ["m3"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_is_retried_per_caller(stand_in):
+    batcher, requests = await stand_in_batcher(stand_in, max_delay=0.05)
+
+    good, bad = await asyncio.gather(
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m1")),
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("bad1")),
+        return_exceptions=True,
+    )
+
+    assert len(requests) == 3
+    assert [s["merchant_uid"] for s in good] == ["m1"]
+    assert isinstance(bad, ResponseError)
+
+
+@pytest.mark.asyncio
+async def test_bad_request_batch_is_retried_per_caller(stand_in):
+    batcher, requests = await stand_in_batcher(stand_in, max_delay=0.05)
+
+    good, bad = await asyncio.gather(
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m1")),
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("invalid1")),
+        return_exceptions=True,
+    )
+
+    assert len(requests) == 3
+    assert [s["merchant_uid"] for s in good] == ["m1"]
+    assert isinstance(bad, async_iamport.HttpError) and bad.code == 400
+
+
+@pytest.mark.asyncio
+async def test_max_size_flushes_batch(stand_in):
+    batcher, requests = await stand_in_batcher(stand_in, max_delay=10, max_size=2)
+
+    await asyncio.gather(
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m1")),
+        batcher.pay_schedule(customer_uid="c1", schedules=schedules("m2")),
+    )
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_unschedule_is_merged(stand_in):
+    batcher, requests = await stand_in_batcher(stand_in, max_delay=0.05)
+
+    first, second = await asyncio.gather(
+        batcher.pay_unschedule(customer_uid="c1", merchant_uid="m1"),
+        batcher.pay_unschedule(customer_uid="c1", merchant_uid=["m2", "m3"]),
+    )
+
+    assert requests == [{"customer_uid": "c1", "merchant_uid": ["m1", "m2", "m3"]}]
+    assert [s["merchant_uid"] for s in first] == ["m1"]
+    assert [s["merchant_uid"] for s in second] == ["m2", "m3"]
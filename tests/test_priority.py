@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from async_iamport import Priority, PriorityScheduler
+
+
+@pytest.mark.asyncio
+async def test_interactive_jumps_the_queue():
+    """
+    given
+        scheduler with every slot in use and a background call waiting
+    when
+        interactive call comes after it
+    then
+        interactive call gets the next free slot first
+    """
+    scheduler = PriorityScheduler(capacity=2, reserved=1)
+    await scheduler.acquire(Priority.INTERACTIVE)
+    await scheduler.acquire(Priority.INTERACTIVE)
+
+    order = []
+
+    async def call(priority):
+        await scheduler.acquire(priority)
+        order.append(priority)
+
+    background = asyncio.ensure_future(call(Priority.BACKGROUND))
+    await asyncio.sleep(0)
+    interactive = asyncio.ensure_future(call(Priority.INTERACTIVE))
+    await asyncio.sleep(0)
+
+    scheduler.release()
+    await interactive
+    assert order == [Priority.INTERACTIVE]
+
+    scheduler.release()
+    scheduler.release()
+    await background
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+@pytest.mark.asyncio
+async def test_background_keeps_reserved_slots_free():
+    scheduler = PriorityScheduler(capacity=2, reserved=1)
+    await scheduler.acquire(Priority.BACKGROUND)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler.acquire(Priority.BACKGROUND), 0.05)
+    await asyncio.wait_for(scheduler.acquire(Priority.INTERACTIVE), 0.05)
+    assert scheduler.in_use == 2
+    assert scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_call_with_priority(iamport):
+    with iamport.priority(Priority.BACKGROUND):
+        assert False is await iamport.is_paid(amount=1000, merchant_uid="qwer1234")
+
+
+@pytest.mark.asyncio
+async def test_shrunk_capacity_is_not_exceeded():
+    scheduler = PriorityScheduler(capacity=4, reserved=2)
+    scheduler.resize(1)
+    await scheduler.acquire(Priority.BACKGROUND)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler.acquire(Priority.INTERACTIVE), 0.05)
+    assert scheduler.in_use == 1
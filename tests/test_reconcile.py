@@ -0,0 +1,68 @@
+import multiprocessing
+import time
+
+import pytest
+
+from async_iamport import ReconciliationRunner
+from async_iamport.reconcile import split_windows
+
+
+def test_split_windows():
+    assert split_windows(0, 25, 10) == [(0, 9), (10, 19), (20, 25)]
+    assert split_windows(0, 20, 10) == [(0, 9), (10, 20)]
+    assert split_windows(10, 10, 10) == [(10, 10)]
+    assert split_windows(10, 5, 10) == []
+
+
+@pytest.mark.asyncio
+async def test_reconciliation_runner_keeps_started_order(iamport):
+    runner = ReconciliationRunner(iamport)
+    with pytest.raises(ValueError):
+        async for _ in runner.run("paid", 0, 10, sorting="-started"):
+            pass
+
+
+def imp_uid_of(payment):
+    return payment["imp_uid"]
+
+
+@pytest.mark.asyncio
+async def test_reconciliation_runner(iamport):
+    end = int(time.time())
+    runner = ReconciliationRunner(
+        iamport, processes=2, window=24 * 60 * 60, transform=imp_uid_of
+    )
+    imp_uids = [
+        imp_uid async for imp_uid in runner.run("paid", end - 3 * 24 * 60 * 60, end)
+    ]
+    assert all(isinstance(imp_uid, str) for imp_uid in imp_uids)
+
+
+@pytest.mark.asyncio
+async def test_payment_on_window_boundary_is_yielded_once(stand_in):
+    started_at = [0, 9, 10, 19, 20, 25]
+
+    async def find_by_status(request):
+        # from and to are both inclusive
+        start, end = int(request.query["from"]), int(request.query["to"])
+        payments = [
+            {"imp_uid": "imp_%s" % t, "started_at": t}
+            for t in started_at
+            if start <= t <= end
+        ]
+        return stand_in.ok({"total": len(payments), "next": 0, "list": payments})
+
+    server = await stand_in.start(
+        {("GET", "/payments/status/{status}"): find_by_status}
+    )
+    runner = ReconciliationRunner(
+        stand_in.client(server),
+        processes=2,
+        window=10,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    payments = [payment async for payment in runner.run("paid", 0, 25)]
+
+    assert [payment["started_at"] for payment in payments] == started_at
+    payments = [payment async for payment in runner.run("paid", 25, 25)]
+    assert [payment["started_at"] for payment in payments] == [25]
@@ -0,0 +1,150 @@
+import time
+
+import aiohttp
+import pytest
+
+import async_iamport
+from async_iamport import (
+    DueSubscription,
+    IteratorSubscriptionSource,
+    RenewalEngine,
+    SQLiteSubscriptionSource,
+    SubscriptionSource,
+)
+
+
+async def due_subscriptions(count):
+    for i in range(count):
+        yield DueSubscription(
+            merchant_uid="renewal_%s_%s" % (i, time.time()),
+            customer_uid="00000000",
+            amount=5000,
+            name="정기결제",
+        )
+
+
+async def async_iter(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_renewal_without_billing_key(iamport):
+    source = IteratorSubscriptionSource(due_subscriptions(3))
+    engine = RenewalEngine(iamport, source, batch_size=2)
+
+    assert 3 == await engine.run()
+    assert [result.status for result in source.results] == ["no_billing_key"] * 3
+
+
+@pytest.mark.asyncio
+async def test_sqlite_lease_is_not_claimed_twice(tmp_path):
+    source = SQLiteSubscriptionSource(str(tmp_path / "renewal.db"))
+    await source.add(
+        [DueSubscription("merchant_%s" % i, "customer", 1000) for i in range(5)]
+    )
+
+    first = await source.claim("worker-1", 3, lease_seconds=60)
+    second = await source.claim("worker-2", 3, lease_seconds=60)
+    assert len(first) == 3
+    assert len(second) == 2
+    assert not {s.merchant_uid for s in first} & {s.merchant_uid for s in second}
+    assert [] == await source.claim("worker-3", 3, lease_seconds=60)
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_expired_lease_is_claimed_again(tmp_path):
+    source = SQLiteSubscriptionSource(str(tmp_path / "renewal.db"))
+    await source.add([DueSubscription("merchant", "customer", 1000)])
+
+    await source.claim("crashed", 1, lease_seconds=-1)
+    (subscription,) = await source.claim("worker", 1, lease_seconds=60)
+    assert subscription.attempt == 2
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_keeps_extra(tmp_path):
+    source = SQLiteSubscriptionSource(str(tmp_path / "renewal.db"))
+    extra = {"buyer_email": "buyer@example.com", "custom_data": {"plan": "pro"}}
+    await source.add([DueSubscription("merchant", "customer", 1000, extra=extra)])
+
+    (subscription,) = await source.claim("worker", 1, lease_seconds=60)
+    assert subscription.extra == extra
+    await source.close()
+
+
+class BrokenIamport:
+    async def find_by_merchant_uid(self, merchant_uid):
+        raise aiohttp.ServerDisconnectedError()
+
+    async def pay_again(self, **kwargs):
+        # not a payment, reading it fails
+        return None
+
+
+@pytest.mark.asyncio
+async def test_failing_subscription_does_not_drop_batch():
+    source = IteratorSubscriptionSource(
+        async_iter(
+            [
+                DueSubscription("retried", "customer", 1000, attempt=2),
+                DueSubscription("broken", "customer", 1000),
+            ]
+        )
+    )
+    engine = RenewalEngine(BrokenIamport(), source, check_billing_key=False)
+
+    assert 2 == await engine.run_once()
+    assert [(r.merchant_uid, r.status) for r in source.results] == [
+        ("retried", "unknown"),
+        ("broken", "unknown"),
+    ]
+
+
+class ChargingIamport:
+    def __init__(self, found):
+        self.found = found
+        self.charged = []
+
+    async def find_by_merchant_uid(self, merchant_uid):
+        if self.found is None:
+            raise async_iamport.HttpError(404, "Not Found")
+        return self.found
+
+    async def pay_again(self, **kwargs):
+        self.charged.append(kwargs["merchant_uid"])
+        return {"status": "paid", "imp_uid": "imp_charged"}
+
+
+async def renew_reclaimed(iamport):
+    source = IteratorSubscriptionSource(
+        async_iter([DueSubscription("reclaimed", "customer", 1000, attempt=2)])
+    )
+    engine = RenewalEngine(iamport, source, check_billing_key=False)
+    await engine.run_once()
+    return source.results
+
+
+@pytest.mark.asyncio
+async def test_reclaimed_paid_subscription_is_not_charged_again():
+    iamport = ChargingIamport({"status": "paid", "imp_uid": "imp_earlier"})
+
+    (result,) = await renew_reclaimed(iamport)
+    assert iamport.charged == []
+    assert (result.status, result.imp_uid) == ("paid", "imp_earlier")
+
+
+@pytest.mark.asyncio
+async def test_reclaimed_subscription_not_found_is_charged():
+    iamport = ChargingIamport(None)
+
+    (result,) = await renew_reclaimed(iamport)
+    assert iamport.charged == ["reclaimed"]
+    assert (result.status, result.imp_uid) == ("paid", "imp_charged")
+
+
+def test_subscription_source_is_abstract():
+    with pytest.raises(TypeError):
+        SubscriptionSource()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from async_iamport import AdaptiveLimiter, ResponseError
+from async_iamport.stream import ListParser
+
+PAGE = {
+    "code": 0,
+    "message": None,
+    "response": {
+        "total": 2,
+        "previous": 0,
+        "next": 0,
+        "list": [
+            {"imp_uid": "imp_1", "amount": 1000, "name": "주문명 ]}"},
+            {"imp_uid": "imp_2", "amount": 2000.5, "cancel_history": []},
+        ],
+    },
+}
+
+
+def feed_in_chunks(text, size):
+    parser = ListParser()
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i : i + size]))
+    return parser, items
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1024])
+def test_list_parser_yields_items(size):
+    parser, items = feed_in_chunks(json.dumps(PAGE, ensure_ascii=False), size)
+
+    assert parser.done
+    assert items == PAGE["response"]["list"]
+    assert parser.envelope == {"code": 0, "message": None}
+    assert parser.meta == {"total": 2, "previous": 0, "next": 0}
+
+
+def test_list_parser_response_list():
+    page = {"code": 0, "message": None, "response": [{"merchant_uid": "1"}]}
+    parser, items = feed_in_chunks(json.dumps(page, indent=2), 5)
+
+    assert parser.done
+    assert items == page["response"]
+
+
+def test_list_parser_numbers_cut_in_chunks():
+    page = {"code": 0, "message": None, "response": [1, 2.5, 3e2, -4.25e-1, 60]}
+    parser, items = feed_in_chunks(json.dumps(page), 1)
+
+    assert parser.done
+    assert items == page["response"]
+
+
+@pytest.mark.asyncio
+async def test_find_by_status_stream(iamport):
+    payments = [
+        payment async for payment in iamport.find_by_status_stream("paid", limit=5)
+    ]
+    assert len(payments) <= 5
+
+
+@pytest.mark.asyncio
+async def test_closed_stream_releases_slot(stand_in):
+    async def find_by_status(request):
+        return web.json_response(PAGE)
+
+    server = await stand_in.start(
+        {("GET", "/payments/status/{status}"): find_by_status}
+    )
+    limiter = AdaptiveLimiter(initial_limit=1)
+    iamport = stand_in.client(server, limiter=limiter)
+
+    stream = iamport.find_by_status_stream("paid")
+    assert (await stream.__anext__())["imp_uid"] == "imp_1"
+    assert limiter.in_flight == 1
+    await stream.aclose()
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_error_keeps_message(stand_in):
+    async def find_by_status(request):
+        # the client gets the code before the message
+        response = web.StreamResponse()
+        response.content_type = "application/json"
+        await response.prepare(request)
+        await response.write(b'{"code": -1, ')
+        await asyncio.sleep(0.05)
+        body = '"message": "허용되지 않는 status", "response": null}'
+        await response.write(body.encode())
+        await response.write_eof()
+        return response
+
+    server = await stand_in.start(
+        {("GET", "/payments/status/{status}"): find_by_status}
+    )
+    iamport = stand_in.client(server)
+
+    with pytest.raises(ResponseError) as e:
+        async for _ in iamport.find_by_status_stream("unknown"):
+            pass
+    assert e.value.code == -1
+    assert e.value.message == "허용되지 않는 status"
@@ -19,3 +19,19 @@ async def test_token_renewed_when_expire_is_under_60s(iamport):
     await iamport._get_token()
     post_token_expire = iamport.token_expire
     assert pre_token_expire == post_token_expire
+
+
+@pytest.mark.asyncio
+async def test_token_renewed_when_expire_is_past(iamport):
+    """
+    given
+        iamport client with new token
+    when
+        set token_expire in the past
+    then
+        token is renewed instead of reused
+    """
+    await iamport._get_token()
+    iamport.token_expire = arrow.utcnow().shift(seconds=-30)
+    await iamport._get_token()
+    assert iamport.token_expire > arrow.utcnow()
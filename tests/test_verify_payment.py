@@ -0,0 +1,69 @@
+import pytest
+
+import async_iamport
+
+
+@pytest.mark.asyncio
+async def test_verify_payment_not_found(iamport):
+    with pytest.raises(async_iamport.HttpError) as e:
+        await iamport.verify_payment("imp_000000000000", "1234qwer", 1000)
+        assert e.code == 404
+
+
+def test_payment_verification_ok():
+    verification = async_iamport.PaymentVerification(
+        payment={"status": "paid", "amount": 1000, "merchant_uid": "1234qwer"},
+        paid=True,
+        merchant_uid_matched=True,
+        prepared=None,
+    )
+    assert verification.ok
+    assert not verification._replace(prepared=False).ok
+    assert not verification._replace(paid=False).ok
+
+
+class StubIamport(async_iamport.AsyncIamport):
+    def __init__(self, payment):
+        super().__init__(imp_key="imp_apikey", imp_secret="secret")
+        self.payment = payment
+        self.cancelled = []
+
+    async def find_by_imp_uid(self, imp_uid):
+        return self.payment
+
+    async def prepare_validate(self, merchant_uid, amount):
+        return None
+
+    async def cancel_by_imp_uid(self, imp_uid, reason):
+        self.cancelled.append(imp_uid)
+        return {"status": "cancelled"}
+
+
+@pytest.mark.asyncio
+async def test_verify_payment_cancels_wrong_amount():
+    iamport = StubIamport({"status": "paid", "amount": 900, "merchant_uid": "1234qwer"})
+    try:
+        verification = await iamport.verify_payment(
+            "imp_1", "1234qwer", 1000, auto_cancel=True
+        )
+    finally:
+        await iamport.close_session()
+    assert not verification.ok
+    assert verification.cancelled == {"status": "cancelled"}
+    assert iamport.cancelled == ["imp_1"]
+
+
+@pytest.mark.asyncio
+async def test_verify_payment_does_not_cancel_other_merchant_uid():
+    iamport = StubIamport(
+        {"status": "paid", "amount": 1000, "merchant_uid": "other_order"}
+    )
+    try:
+        verification = await iamport.verify_payment(
+            "imp_1", "1234qwer", 1000, auto_cancel=True
+        )
+    finally:
+        await iamport.close_session()
+    assert not verification.merchant_uid_matched
+    assert verification.cancelled is None
+    assert iamport.cancelled == []